@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths of both simulations: trapline formation and the waggle dance hive.
+
+Micro-benchmarks time single calls of the methods the main loops spend their time in;
+macro-benchmarks time whole bouts and whole hive timesteps. Every result is a time per
+unit of work (lower is better). Each run is appended to a JSON history, and can be
+compared against a stored baseline to catch regressions:
+
+    python benchmarks.py                   # run, append to history, compare to baseline
+    python benchmarks.py --save-baseline   # run and store the results as the new baseline
+    python benchmarks.py --quick           # fewer repeats and smaller hives
+
+@author: tp275
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "trapline_formation"))
+sys.path.insert(0, os.path.join(HERE, "..", "waggle_dance"))
+import singleBee
+import beeBatch
+import navigationSimulation
+import hiveSim
+import colonyEngine
+import siteIndex
+import hiveEvents
+
+HISTORY_FILE = os.path.join(HERE, "history.json")
+BASELINE_FILE = os.path.join(HERE, "baseline.json")
+
+def time_per_call(func, repeat=5, min_time=0.2):
+    """
+    Returns the best time (s) of one call of func, timing as many calls at once
+    as take at least min_time, repeat times
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time/max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number
+
+def time_per_step(step, max_steps, budget):
+    """
+    Calls step until max_steps calls or budget seconds have passed (at least one call),
+    returning the mean time (s) of one call
+    """
+    steps = 0
+    start = time.perf_counter()
+    while steps < max_steps and (steps == 0 or time.perf_counter()-start < budget):
+        step()
+        steps += 1
+    return (time.perf_counter()-start) / steps
+
+
+########## MICRO-BENCHMARKS ##########
+
+def completed_bee():
+    """Returns a trapline bee that has just completed a bout, ready to update its probabilities
+    """
+    bee = singleBee.Bee(False, np.random.default_rng(0))
+    while True:
+        bee.start_bout()
+        while not bee.has_visited_all():
+            bee.move()
+            if bee.location == 0:
+                break
+        if bee.has_visited_all():
+            bee.return_to_nest()
+            return bee
+
+def bench_get_destination(repeat):
+    bee = singleBee.Bee(False, np.random.default_rng(0))
+    bee.location = 3
+    return time_per_call(bee.get_destination, repeat)
+
+def bench_get_total_distance(repeat):
+    return time_per_call(completed_bee().get_total_distance, repeat)
+
+def bench_update_probability_matrix(repeat):
+    bee = completed_bee()
+    # a factor of 1 leaves the probabilities as they are, so every call does the same work
+    return time_per_call(lambda: bee.update_probability_matrix(1.0), repeat)
+
+def bench_recruit(repeat):
+    random.seed(0)
+    idle_bees = hiveSim.IdleIndex(hiveSim.create_bees(500))
+    recruited = []
+    def recruit():
+        for bee in recruited: # undo the last call's recruitment
+            bee.state = 0
+            idle_bees.add(bee)
+        recruited[:] = hiveSim.recruit(idle_bees, 90)
+    return time_per_call(recruit, repeat)
+
+def bench_add_to_state_stats(repeat):
+    bees = hiveSim.create_bees(500)
+    stats = hiveSim.BeeStats(1)
+    def add():
+        stats.add_to_state_stats(bees)
+        stats.num_states = 0 # don't let the arrays grow between calls
+    return time_per_call(add, repeat)
+
+def bench_add_transitions(repeat):
+    """Time of a timestep's stats: state numbers from transitions, and site numbers"""
+    stats = hiveSim.BeeStats(1)
+    stats.add_state_counts(400, 50, 50)
+    site_numbers = dict.fromkeys(hiveSim.sites, 1)
+    def add():
+        stats.add_transitions(10, 2, 8, 20)
+        stats.add_to_site_stats(site_numbers)
+        # don't let the arrays grow between calls
+        stats.num_states = 1
+        stats.num_site_rows = 0
+    return time_per_call(add, repeat)
+
+def bench_site_index_query(repeat):
+    """Time per heading of a batched query of 10^4 headings and ranges, over 5000 patches"""
+    rng = np.random.default_rng(0)
+    index = siteIndex.SiteIndex(rng.uniform(0, 360, 5000), rng.uniform(1, 100, 5000),
+                                rng.uniform(50, 1000, 5000), angle_tolerance=0.5,
+                                distance_tolerance=25)
+    headings, ranges = rng.uniform(0, 360, 10**4), rng.uniform(50, 1000, 10**4)
+    return time_per_call(lambda: index.query(headings, ranges), repeat) / 10**4
+
+
+########## MACRO-BENCHMARKS ##########
+
+def bench_trapline_serial(runs=4, bouts=250):
+    """Time per bout of the per-bee main loop"""
+    start = time.perf_counter()
+    for r in range(runs):
+        navigationSimulation.simulate_run(bouts, rng=np.random.default_rng(r))
+    return (time.perf_counter()-start) / (runs*bouts)
+
+def bench_trapline_batch(runs=2000, bouts=250):
+    """Time per bout (of one bee) of the batched engine"""
+    start = time.perf_counter()
+    beeBatch.simulate(runs, bouts, navigationSimulation.prob_enhancement_factor,
+                      rng=np.random.default_rng(0), record=False)
+    return (time.perf_counter()-start) / (runs*bouts)
+
+def bench_hive(num_bees, max_steps=200, budget=5.0):
+    """Time per timestep of the hive main loop, for a colony of num_bees"""
+    random.seed(0)
+    bees = hiveSim.create_bees(num_bees)
+    idle_bees = hiveSim.IdleIndex(bees) # kept across timesteps, as HiveSimulation does
+    return time_per_step(lambda: hiveSim.timestep(bees, hiveSim.sites, idle_bees=idle_bees),
+                         max_steps, budget)
+
+def bench_hive_events(num_bees, max_steps=200, budget=5.0):
+    """Time per timestep of the event-driven hive scheduler, for a colony of num_bees"""
+    random.seed(0)
+    scheduler = hiveEvents.EventScheduler(hiveSim.create_bees(num_bees), hiveSim.sites)
+    return time_per_step(scheduler.step, max_steps, budget)
+
+def bench_colony(num_bees, max_steps=200, budget=5.0):
+    """Time per timestep of the vectorised colony engine, for a colony of num_bees"""
+    colony = colonyEngine.Colony(num_bees, hiveSim.sites, np.random.default_rng(0))
+    return time_per_step(colony.timestep, max_steps, budget)
+
+def run_benchmarks(quick=False):
+    """Runs every benchmark, returning a dictionary of name to seconds per unit of work
+    """
+    repeat = 3 if quick else 5
+    hive_sizes = (500, 10**4) if quick else (500, 10**4, 10**5)
+    colony_sizes = (10**5,) if quick else (10**5, 10**6)
+    results = {"get_destination": bench_get_destination(repeat),
+               "get_total_distance": bench_get_total_distance(repeat),
+               "update_probability_matrix": bench_update_probability_matrix(repeat),
+               "recruit_500": bench_recruit(repeat),
+               "add_to_state_stats_500": bench_add_to_state_stats(repeat),
+               "add_transitions": bench_add_transitions(repeat),
+               "site_index_query_per_heading": bench_site_index_query(repeat),
+               "trapline_serial_per_bout": bench_trapline_serial(2 if quick else 4),
+               "trapline_batch_per_bout": bench_trapline_batch(500 if quick else 2000)}
+    for num_bees in hive_sizes:
+        results["hive_" + str(num_bees) + "_per_timestep"] = bench_hive(
+                num_bees, budget=2.0 if quick else 5.0)
+    for num_bees in hive_sizes:
+        results["hive_events_" + str(num_bees) + "_per_timestep"] = bench_hive_events(
+                num_bees, budget=2.0 if quick else 5.0)
+    for num_bees in colony_sizes:
+        results["colony_" + str(num_bees) + "_per_timestep"] = bench_colony(
+                num_bees, budget=2.0 if quick else 5.0)
+    return results
+
+
+########## HISTORY AND BASELINE ##########
+
+def describe_environment():
+    """Returns a dictionary describing where and on what code the benchmarks ran
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor()}
+
+def append_history(entry, path=HISTORY_FILE):
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(entry)
+    with open(path, "w") as f:
+        json.dump(history, f, indent=1)
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (name, result, baseline result, ratio, regressed) for every benchmark
+    in both, a regression being a result more than threshold times slower than baseline
+    """
+    comparison = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result / baseline[name]
+            comparison.append((name, result, baseline[name], ratio, ratio > threshold))
+    return comparison
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--quick", action="store_true", help="fewer repeats, smaller hives")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="slowdown ratio counted as a regression (default 1.5)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick)
+    entry = {"environment": describe_environment(), "quick": args.quick, "results": results}
+    append_history(entry)
+    for name, result in results.items():
+        print(name + ": " + "{:.3g}".format(result) + " s (" + "{:.3g}".format(1/result) + "/s)")
+
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(entry, f, indent=1)
+        print("\nSaved as baseline")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)["results"]
+        print("\nCompared to baseline:")
+        regressions = 0
+        for name, result, base, ratio, regressed in compare(results, baseline, args.threshold):
+            print(name + ": x" + "{:.2f}".format(ratio) + (" REGRESSION" if regressed else ""))
+            regressions += regressed
+        sys.exit(1 if regressions else 0)
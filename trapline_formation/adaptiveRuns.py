@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for running the main simulation only for as many runs as are needed:
+runs are added in batches until the confidence intervals of the key statistics
+are as narrow as requested, or a maximum number of runs is reached.
+
+@author: tp275
+"""
+import math
+import numpy as np
+from scipy import stats
+import beeBatch
+import routeTable
+import streamingStats
+import navigationSimulation
+
+# default confidence interval half-widths wanted for each statistic
+DEFAULT_HALF_WIDTHS = {"bouts_to_optimum": 1.0,
+                       "bouts_to_stable_optimum": 1.0,
+                       "av_distance_first_quarter": 20.0,
+                       "av_distance_last_quarter": 20.0}
+
+# empirical means from Lihoreau et al. (2012) to test the simulated means against
+EMPIRICAL_MEANS = {"bouts_to_optimum": 18.0, "bouts_to_stable_optimum": 27.0}
+
+def get_interval(running_stats, confidence):
+    """Returns the mean and confidence interval half-width of a streamingStats.RunningStats
+    """
+    n = running_stats.count
+    if n < 2:
+        return running_stats.mean if n else math.nan, math.inf
+    t = stats.t.ppf(0.5 + confidence/2, n-1)
+    return running_stats.mean, t * running_stats.get_std()/math.sqrt(n)
+
+def run_adaptive(half_widths=DEFAULT_HALF_WIDTHS, confidence=0.95, batch_size=200,
+                 max_runs=20000, bouts=navigationSimulation.bouts,
+                 prob_enhancement_factor=navigationSimulation.prob_enhancement_factor,
+                 set_2013_probs=navigationSimulation.set_2013_probs,
+                 novelty_extension=navigationSimulation.novelty_extension,
+                 swap_point=navigationSimulation.swap_point, seed=None):
+    """
+    Simulates batches of runs (with the batch engine) until every statistic named in
+    half_widths has a confidence interval no wider than mean +- its half-width,
+    or max_runs have been simulated.
+    Returns a dictionary of the number of runs simulated, whether every target was met,
+    and per statistic its mean, achieved half-width, target and number of values
+    (plus, where there is an empirical mean, the t-test p-value against it)
+    """
+    rng = np.random.default_rng(seed)
+    route_table = routeTable.RouteTable()
+    running = streamingStats.StreamingStats(bouts, route_table)
+    runs = 0
+    while True:
+        batch_runs = min(batch_size, max_runs-runs)
+        beeBatch.simulate(batch_runs, bouts, prob_enhancement_factor, set_2013_probs,
+                          novelty_extension, swap_point, rng=rng, route_table=route_table,
+                          stats=running, record=False)
+        runs += batch_runs
+
+        results = {}
+        for name, target in half_widths.items():
+            statistic = getattr(running, name)
+            mean, half_width = get_interval(statistic, confidence)
+            results[name] = {"mean": float(mean), "half_width": float(half_width), "target": target,
+                             "count": statistic.count}
+            if name in EMPIRICAL_MEANS and statistic.count > 1:
+                # two-sided one-sample t-test, as stats.ttest_1samp, from the running moments
+                t = (mean-EMPIRICAL_MEANS[name]) / (statistic.get_std()/math.sqrt(statistic.count))
+                results[name]["p_value"] = float(2 * stats.t.sf(abs(t), statistic.count-1))
+        converged = all(result["half_width"] <= result["target"] for result in results.values())
+        if converged or runs >= max_runs:
+            return {"runs": runs, "converged": converged, "statistics": results}
+
+
+if __name__ == "__main__":
+    adaptive = run_adaptive()
+    print("Runs simulated: " + str(adaptive["runs"])
+          + (" (targets met)" if adaptive["converged"] else " (maximum reached)"))
+    for name, result in adaptive["statistics"].items():
+        print("\n" + name + ": " + str(result["mean"]) + " +- " + str(result["half_width"])
+              + " (target +- " + str(result["target"]) + ", " + str(result["count"]) + " values)")
+        if "p_value" in result:
+            print("Empirical mean: " + str(EMPIRICAL_MEANS[name]))
+            print(result["p_value"])
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module containing the batch bee class, an alternative to running one Bee per run:
+every bee's variables are stacked into numpy arrays (first axis = run), so all
+bees are moved together with one vectorised step per move, until only a few
+stragglers are left out foraging, which are finished one at a time
+
+@author: tp275
+"""
+import numpy as np
+from bisect import bisect_right
+from itertools import accumulate
+import singleBee
+import routeTable
+
+class BeeBatch:
+    """
+    A batch of bees, one for each run, which are all stepped at once.
+    Holds the same variables as singleBee.Bee, but for every bee at the same time.
+    Each bee's route is kept as an integer code (see routeTable.encode_route), updated
+    every move, rather than as a list, so routes take the same memory however long
+    the longest is. Moves of routes too long for a code are kept in an overflow
+    buffer that only those bees write to.
+    As in singleBee.Bee, bout distances are summed over the transitions made, and only
+    the transitions recorded this bout are cleared and updated, so a bout costs time in
+    proportion to the moves taken rather than to the size of the layout.
+    """
+    def __init__(self, runs, set_2013_probs, rng=None, distance_matrix=None, straggler_limit=16):
+        # use a single bee as a template for the initial matrices
+        template = singleBee.Bee(set_2013_probs, distance_matrix=distance_matrix)
+        self.runs = runs
+        self.rng = np.random.default_rng() if rng is None else rng
+        # once this few bees are still out, they are finished one at a time (see finish_stragglers)
+        self.straggler_limit = straggler_limit
+
+        # distances are shared by all bees
+        self.distance_matrix = np.array(template.distance_matrix)
+        self.num_locations = len(self.distance_matrix)
+        n = self.num_locations
+
+        # (runs, 6, 6) stack of each bee's transition probability matrix
+        self.transition_probability_matrix = np.repeat(
+                [np.asarray(template.transition_probability_matrix, dtype=float)], runs, axis=0)
+
+        # (runs, 6, 6) stack of each bee's transition recording matrix, plus arrays of the
+        # (bee, from, to) transitions recorded in it this bout, one triple per move
+        self.transition_recording_matrix = np.zeros((runs, n, n), dtype=int)
+        self.transition_bees = []
+        self.transition_froms = []
+        self.transition_tos = []
+
+        # each bee's current location
+        self.location = np.zeros(runs, dtype=int)
+
+        # (runs, 6) boolean 'set' of unique visited locations
+        self.unique_visited_locations = np.zeros((runs, n), dtype=bool)
+
+        # each bee's route this bout as a code, the number of moves in the code, and
+        # whether the route outgrew its code, its later moves going to the overflow buffer
+        self.route_codes = np.zeros(runs, dtype=np.int64)
+        self.code_moves = np.zeros(runs, dtype=int)
+        self.max_code_moves = routeTable.max_code_moves(n)
+        self.overflowed = np.zeros(runs, dtype=bool)
+        # the overflow buffer: arrays of bee indexes and their locations, one pair per move
+        self.overflow_bees = []
+        self.overflow_locations = []
+        # the whole routes of bees finished one at a time, by bee index
+        self.straggler_routes = {}
+
+        # whether each bee visited all flowers in its current bout
+        self.complete_run = np.zeros(runs, dtype=bool)
+
+        # the current minimum total bout distance found by each bee
+        self.min_distance = np.full(runs, np.inf)
+
+    def reset_bout(self):
+        """Puts every bee back in the nest, with empty location and transition records
+        """
+        self.location[:] = 0
+        self.unique_visited_locations[:] = False
+        self.unique_visited_locations[:, 0] = True
+        self.route_codes[:] = routeTable.encode_route([0], self.num_locations)
+        self.code_moves[:] = 0
+        self.overflowed[:] = False
+        self.overflow_bees = []
+        self.overflow_locations = []
+        self.straggler_routes = {}
+        self.complete_run[:] = False
+        self.reset_transition_matrix()
+
+    def run_bout(self):
+        """
+        Undertakes one whole foraging bout for every bee, moving all bees that are
+        still out together until each has visited all flowers or returned to the nest early
+        """
+        self.reset_bout()
+        active = np.arange(self.runs) # indexes of bees still out foraging
+        while active.size > self.straggler_limit:
+            self.move(active)
+            # bees that returned to the nest before visiting every flower are incomplete
+            returned = self.location[active] == 0
+            # bees that visited all locations return to the nest and are complete
+            done = self.unique_visited_locations[active].all(axis=1)
+            finished = active[done]
+            self.complete_run[finished] = True
+            self.record_transitions(finished, self.location[finished], 0)
+            self.record_locations(finished, 0)
+            active = active[~(returned | done)]
+        self.finish_stragglers(active)
+
+    def move(self, active):
+        """Undertakes one location-to-location move of each of the given (active) bees
+        """
+        dest = self.get_destinations(active)
+        self.record_transitions(active, self.location[active], dest)
+        self.location[active] = dest
+        self.unique_visited_locations[active, dest] = True
+        self.record_locations(active, dest)
+
+    def get_destinations(self, active):
+        """
+        Returns the next location of each given bee, drawn from its probability matrix.
+        Inverse transform sampling, as np.random.choice does, but for all rows at once.
+        """
+        rows = self.transition_probability_matrix[active, self.location[active]]
+        cdf = np.cumsum(rows, axis=1)
+        u = self.rng.random(len(active)) * cdf[:, -1]
+        dest = np.sum(cdf <= u[:, None], axis=1)
+        # guard against rounding choosing an impossible destination past the last non-zero
+        last_possible = self.num_locations - 1 - np.argmax(rows[:, ::-1] > 0, axis=1)
+        return np.minimum(dest, last_possible)
+
+    def finish_stragglers(self, bees):
+        """
+        Finishes the bouts of the given bees one at a time, drawing destinations as
+        get_destinations does. Once only a few bees are still out, a vectorised move costs
+        far more per bee than a scalar one, and a bee circling between a few flowers can
+        take thousands of moves to visit them all or return to the nest.
+        """
+        if bees.size == 0:
+            return
+        n = self.num_locations
+        for bee, route in zip(bees.tolist(), self.get_routes(bees)):
+            probs = self.transition_probability_matrix[bee]
+            recording = self.transition_recording_matrix[bee]
+            # cumulative table, total, last possible destination, and whether a binary search
+            # finds the same destination, of each row, built when first left
+            tables = {}
+            visited = set(route)
+            first_move = len(route) - 1
+            location = route[-1]
+            uniforms = []
+            while True:
+                if location not in tables:
+                    row = probs[location].tolist()
+                    cdf = list(accumulate(row)) # the same sums as np.cumsum
+                    last_possible = next((i for i in range(n-1, -1, -1) if row[i] > 0), n-1)
+                    tables[location] = (cdf, cdf[-1], last_possible, min(row) >= 0)
+                cdf, total, last_possible, monotonic = tables[location]
+                if not uniforms:
+                    uniforms = self.rng.random(256).tolist()
+                u = uniforms.pop() * total
+                if monotonic:
+                    dest = bisect_right(cdf, u)
+                else:
+                    dest = sum(c <= u for c in cdf)
+                dest = min(dest, last_possible)
+                recording[location, dest] += 1
+                route.append(dest)
+                location = dest
+                if dest == 0:
+                    break
+                visited.add(dest)
+                if len(visited) == n:
+                    recording[dest, 0] += 1
+                    route.append(0)
+                    self.complete_run[bee] = True
+                    break
+            # the transitions made are the consecutive pairs of the rest of the route
+            moves = np.array(route[first_move:])
+            self.transition_bees.append(np.full(len(moves)-1, bee))
+            self.transition_froms.append(moves[:-1])
+            self.transition_tos.append(moves[1:])
+            self.location[bee] = location
+            self.unique_visited_locations[bee, list(visited)] = True
+            self.straggler_routes[bee] = route
+
+    def record_transitions(self, bees, froms, tos):
+        """Records a transition of each of the given bees (each at most once), from and to the given locations
+        """
+        tos = np.broadcast_to(tos, bees.shape)
+        self.transition_recording_matrix[bees, froms, tos] += 1
+        self.transition_bees.append(bees)
+        self.transition_froms.append(froms)
+        self.transition_tos.append(tos)
+
+    def reset_transition_matrix(self):
+        """
+        Sets the transition recording matrices to all zeros, clearing only the
+        transitions recorded since the last reset
+        """
+        if self.transition_bees:
+            self.transition_recording_matrix[np.concatenate(self.transition_bees),
+                                             np.concatenate(self.transition_froms),
+                                             np.concatenate(self.transition_tos)] = 0
+        self.transition_bees = []
+        self.transition_froms = []
+        self.transition_tos = []
+
+    def record_locations(self, indexes, locations):
+        """Appends the given locations to the routes of the bees at the given indexes
+        """
+        if indexes.size == 0:
+            return
+        locations = np.broadcast_to(locations, indexes.shape)
+        coded = self.code_moves[indexes] < self.max_code_moves
+        if not coded.all():
+            # routes too long for their codes carry on in the overflow buffer
+            self.overflowed[indexes[~coded]] = True
+            self.overflow_bees.append(indexes[~coded])
+            self.overflow_locations.append(locations[~coded])
+            indexes, locations = indexes[coded], locations[coded]
+        self.route_codes[indexes] = self.route_codes[indexes]*self.num_locations + locations
+        self.code_moves[indexes] += 1
+
+    def get_routes(self, indexes=None):
+        """
+        Returns a list of the visited locations in order, as singleBee.Bee stores them,
+        of each of the bees at the given indexes (default all)
+        """
+        indexes = np.arange(self.runs) if indexes is None else indexes
+        overflow_routes = {}
+        if self.overflow_bees:
+            # gather each overflowed bee's moves, which were appended in order
+            bees = np.concatenate(self.overflow_bees)
+            order = np.argsort(bees, kind="stable")
+            bees = bees[order]
+            locations = np.concatenate(self.overflow_locations)[order]
+            starts = np.flatnonzero(np.r_[True, bees[1:] != bees[:-1]])
+            overflow_routes = dict(zip(bees[starts].tolist(),
+                                       (part.tolist() for part in np.split(locations, starts[1:]))))
+        routes = []
+        for bee in indexes.tolist():
+            if bee in self.straggler_routes:
+                routes.append(list(self.straggler_routes[bee]))
+            else:
+                routes.append(routeTable.decode_route(int(self.route_codes[bee]), self.num_locations)
+                              + overflow_routes.get(bee, []))
+        return routes
+
+    def get_route_ids(self, route_table):
+        """
+        Returns the ID of each bee's route this bout, interned in route_table. Routes
+        kept as codes are interned once per distinct code; only the few others are
+        built as lists.
+        """
+        route_ids = np.empty(self.runs, dtype=np.int32)
+        listed = self.overflowed.copy()
+        listed[list(self.straggler_routes)] = True
+        coded = np.flatnonzero(~listed)
+        route_ids[coded] = route_table.intern_codes(self.route_codes[coded], self.num_locations)
+        listed = np.flatnonzero(listed)
+        route_ids[listed] = [route_table.intern(route) for route in self.get_routes(listed)]
+        return route_ids
+
+    def get_total_distances(self):
+        """
+        Returns the summed distance of all transitions made this bout, for each bee.
+        np.bincount adds each bee's transitions in the order they were made, as Bee does.
+        """
+        distances = np.zeros(self.runs)
+        if self.transition_bees:
+            distances = np.bincount(np.concatenate(self.transition_bees),
+                                    self.distance_matrix[np.concatenate(self.transition_froms),
+                                                         np.concatenate(self.transition_tos)],
+                                    minlength=self.runs)
+        return distances.astype(self.distance_matrix.dtype)
+
+    def normalize_probability_matrix(self, bees, rows):
+        """
+        Normalizes (l1) the given rows of the probability matrices of the given bees
+        (one row per bee index), leaving rows of all zeros as they are
+        """
+        probs = self.transition_probability_matrix[bees, rows]
+        row_sums = np.sum(np.abs(probs), axis=1, keepdims=True)
+        row_sums[row_sums == 0] = 1
+        self.transition_probability_matrix[bees, rows] = probs / row_sums
+
+    def update_probability_matrix(self, mask, prob_enhancement_factor):
+        """
+        Updates the probability matrices of the masked bees, heightening probabilities
+        of the transitions in their current bouts by the given factor.
+        The factor can be a single value, or an array of one factor per bee in the batch.
+        Only the rows of locations each bee moved from change.
+        """
+        factors = np.broadcast_to(prob_enhancement_factor, (self.runs,))
+        # a bout ends in the nest, so a bee moved from every location it visited
+        bees, rows = np.nonzero(self.unique_visited_locations & mask[:, None])
+        # create rows to multiply those rows of the probability matrices with
+        mult_mat = self.transition_recording_matrix[bees, rows] * factors[bees, None]
+        # make all 0s 1s, so probs remain the same when multiplied by this matrix
+        mult_mat[mult_mat == 0] = 1
+        self.transition_probability_matrix[bees, rows] *= mult_mat
+        self.normalize_probability_matrix(bees, rows)
+
+
+def get_chunk_size(num_locations, max_chunk_size=10000, max_bytes=2**28):
+    """
+    Returns how many bees to simulate at once for a layout of num_locations, so that
+    their stacked probability and recording matrices take no more than max_bytes
+    """
+    return max(1, min(max_chunk_size, max_bytes // (16*num_locations**2)))
+
+
+def simulate(runs, bouts, prob_enhancement_factor, set_2013_probs=False,
+             novelty_extension=False, swap_point=50, chunk_size=None,
+             rng=None, route_table=None, stats=None, record=True, distance_matrix=None,
+             writer=None, checkpointer=None):
+    """
+    Batched equivalent of running the main loop's bouts for every run.
+    Bees are simulated in chunks of up to chunk_size at a time, to bound memory
+    (by default, as many as get_chunk_size allows for the layout).
+    Returns a (runs, bouts) array of bout distances, a (runs, bouts) array of the
+    route ID of each bout and the RouteTable (a new one if none is given) of those IDs.
+    Each bout is also added to stats, if given (a StreamingStats using the same table);
+    with record set to False, the two arrays aren't kept at all and are returned as None.
+    Any layout of nest and flowers can be given as distance_matrix (see singleBee.Bee).
+    Each chunk's per-bout results are also appended to writer, if given (a resultStore.ResultWriter).
+    If a checkpoint.Checkpointer is given, the whole state (bees, rng, route table, stats and
+    results so far) is saved every checkpointer.every bouts, and if it holds a snapshot of
+    this simulation, the simulation resumes from it; rng, route_table and stats are then
+    set to their saved states.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    route_table = routeTable.RouteTable() if route_table is None else route_table
+    if chunk_size is None:
+        chunk_size = get_chunk_size(6 if distance_matrix is None else len(distance_matrix))
+    distances = None
+    route_ids = np.zeros((runs, bouts), dtype=np.int32) if record else None
+
+    resumed = None
+    if checkpointer is not None:
+        if writer is not None:
+            raise ValueError("results can't be written by a simulation that is checkpointed")
+        parameters = [runs, bouts, prob_enhancement_factor, set_2013_probs, novelty_extension,
+                      swap_point, chunk_size, record, stats is not None,
+                      None if distance_matrix is None else np.asarray(distance_matrix).tolist()]
+        resumed = checkpointer.load()
+    first_start = 0
+    if resumed is not None:
+        if resumed["parameters"] != parameters:
+            raise ValueError("checkpoint " + checkpointer.path
+                             + " is of a simulation with different parameters")
+        first_start = resumed["start"]
+        distances, route_ids = resumed["distances"], resumed["route_ids"]
+        rng.bit_generator.state = resumed["rng_state"]
+        # update the given objects, as the caller holds references to them
+        route_table.__dict__.update(resumed["route_table"].__dict__)
+        if stats is not None:
+            stats.__dict__.update(resumed["stats"].__dict__)
+
+    for start in range(first_start, runs, chunk_size):
+        if resumed is not None:
+            batch, route_counts, first_bout = resumed["batch"], resumed["route_counts"], resumed["bout"]
+            batch.rng = rng
+            resumed = None
+        else:
+            batch = BeeBatch(min(chunk_size, runs-start), set_2013_probs, rng, distance_matrix)
+            route_counts = routeTable.RouteCounts(batch.runs) if novelty_extension else None
+            first_bout = 0
+            if stats is not None:
+                stats.start_runs(batch.runs)
+        if writer is not None:
+            chunk_results = {"distances": np.zeros((batch.runs, bouts)),
+                             "complete": np.zeros((batch.runs, bouts), dtype=bool),
+                             "route_ids": np.zeros((batch.runs, bouts), dtype=np.int32),
+                             "updated": np.zeros((batch.runs, bouts), dtype=bool)}
+
+        for b in range(first_bout, bouts):
+            batch.run_bout()
+            bout_distances = batch.get_total_distances()
+            bout_route_ids = batch.get_route_ids(route_table)
+            if record:
+                if distances is None:
+                    distances = np.zeros((runs, bouts), dtype=bout_distances.dtype)
+                distances[start:start+batch.runs, b] = bout_distances
+                route_ids[start:start+batch.runs, b] = bout_route_ids
+            if stats is not None:
+                stats.add_bout(bout_distances, bout_route_ids)
+
+            # bees whose distance is a new shortest complete route
+            improved = (bout_distances <= batch.min_distance) & batch.complete_run
+            batch.min_distance[improved] = bout_distances[improved]
+
+            if writer is not None:
+                chunk_results["distances"][:, b] = bout_distances
+                chunk_results["complete"][:, b] = batch.complete_run
+                chunk_results["route_ids"][:, b] = bout_route_ids
+                chunk_results["updated"][:, b] = improved
+
+            if novelty_extension:
+                # prob. enhancement factor diminishes and goes negative, per bee
+                repeats = route_counts.add(bout_route_ids)
+                batch.update_probability_matrix(improved,
+                        prob_enhancement_factor-(1.1*(repeats/swap_point)))
+            else:
+                batch.update_probability_matrix(improved, prob_enhancement_factor)
+
+            if checkpointer is not None and checkpointer.is_due(b+1):
+                checkpointer.save({"parameters": parameters, "start": start, "bout": b+1,
+                                   "batch": batch, "route_counts": route_counts,
+                                   "rng_state": rng.bit_generator.state,
+                                   "route_table": route_table, "stats": stats,
+                                   "distances": distances, "route_ids": route_ids})
+
+        if stats is not None:
+            stats.end_runs()
+        if writer is not None:
+            writer.add_runs(**chunk_results)
+
+    return distances, route_ids, route_table
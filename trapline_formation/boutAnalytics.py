@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for working out exactly what a bee's next bout will look like, instead of sampling it.
+
+For a fixed transition probability matrix, a bout is an absorbing Markov chain over
+(current location, set of visited locations) states. It ends in one of two ways:
+returning to the nest early, or visiting every location (then returning to the nest).
+Solving the chain gives the exact probability of completing a bout, the expected
+bout distance and number of moves, and (up to a probability cut-off) the distribution
+over routes. There are up to n*2^(n-1) states, so this is only for small layouts.
+
+@author: tp275
+"""
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+class BoutChain:
+    """
+    The absorbing Markov chain of one bout, for the given probability and distance matrices.
+    Transient states are (location, visited bitmask) pairs reachable from the nest.
+    """
+    def __init__(self, transition_probability_matrix, distance_matrix):
+        self.probs = np.asarray(transition_probability_matrix, dtype=float)
+        self.distances = np.asarray(distance_matrix, dtype=float)
+        self.num_locations = len(self.probs)
+        self.all_visited_mask = (1 << self.num_locations) - 1
+
+        # find every reachable transient state, starting in the nest
+        self.states = [(0, 1)]
+        self.state_indexes = {(0, 1): 0}
+        # transitions between transient states, as (from state, to state, probability, distance),
+        # and into each way of ending the bout, as (from state, probability, distance)
+        self.transient_moves = []
+        self.complete_moves = []
+        self.early_moves = []
+        s = 0
+        while s < len(self.states):
+            location, mask = self.states[s]
+            for dest in np.flatnonzero(self.probs[location]):
+                p = self.probs[location, dest]
+                distance = self.distances[location, dest]
+                new_mask = mask | (1 << int(dest))
+                if dest == 0:
+                    self.early_moves.append((s, p, distance))
+                elif new_mask == self.all_visited_mask:
+                    # the bee returns to the nest from its last new location
+                    self.complete_moves.append((s, p, distance + self.distances[dest, 0]))
+                else:
+                    state = (int(dest), new_mask)
+                    if state not in self.state_indexes:
+                        self.state_indexes[state] = len(self.states)
+                        self.states.append(state)
+                    self.transient_moves.append((s, self.state_indexes[state], p, distance))
+            s += 1
+
+        # the fundamental system (I - Q), where Q holds transient to transient probabilities
+        n = len(self.states)
+        moves = np.array(self.transient_moves, dtype=float).reshape(-1, 4)
+        self.q_rows = moves[:, 0].astype(int)
+        self.q_cols = moves[:, 1].astype(int)
+        self.q_probs = moves[:, 2]
+        self.q_distances = moves[:, 3]
+        q = sparse.csr_matrix((self.q_probs, (self.q_rows, self.q_cols)), shape=(n, n))
+        self.system = (sparse.identity(n, format='csc') - q).tocsc()
+
+    def solve(self, rewards):
+        """Solves (I - Q) x = rewards, giving the expected total reward from every transient state
+        """
+        return spsolve(self.system, rewards)
+
+    def absorbing_vector(self, moves, values=None):
+        """Sums, per transient state, probability * value (default 1) of the given absorbing moves
+        """
+        vector = np.zeros(len(self.states))
+        for s, p, distance in moves:
+            vector[s] += p * (1 if values is None else values(distance))
+        return vector
+
+    def analyse(self):
+        """
+        Returns a dictionary of exact expectations for a bout starting in the nest:
+        p_complete and p_early_return, the probabilities of each way of ending the bout;
+        expected_distance and expected_moves; and expected_distance_complete and
+        expected_distance_early_return, the expected distances given each ending
+        """
+        # probability of completing the bout, from every transient state
+        h_complete = self.solve(self.absorbing_vector(self.complete_moves))
+        p_complete = float(h_complete[0])
+
+        # expected distance covered per move from each state, then summed over the bout
+        move_distances = (np.bincount(self.q_rows, self.q_probs*self.q_distances, len(self.states))
+                          + self.absorbing_vector(self.complete_moves, lambda d: d)
+                          + self.absorbing_vector(self.early_moves, lambda d: d))
+        expected_distance = float(self.solve(move_distances)[0])
+        # each completed bout also has a final move back to the nest
+        expected_moves = float(self.solve(np.ones(len(self.states)))[0]) + p_complete
+
+        # distance given completion: only count distance on the way to completing
+        complete_distances = (np.bincount(self.q_rows,
+                                          self.q_probs*self.q_distances*h_complete[self.q_cols],
+                                          len(self.states))
+                              + self.absorbing_vector(self.complete_moves, lambda d: d))
+        distance_and_complete = float(self.solve(complete_distances)[0])
+
+        return {"p_complete": p_complete,
+                "p_early_return": 1 - p_complete,
+                "expected_distance": expected_distance,
+                "expected_moves": expected_moves,
+                "expected_distance_complete": distance_and_complete/p_complete
+                                              if p_complete > 0 else np.nan,
+                "expected_distance_early_return": (expected_distance-distance_and_complete)
+                                                  / (1-p_complete) if p_complete < 1 else np.nan}
+
+    def route_distribution(self, min_probability=1e-6):
+        """
+        Returns a dictionary of route (tuple of locations, as Bee.visited_locations) to its
+        exact probability, for every route at least as likely as min_probability.
+        Routes can revisit flowers, so there are infinitely many; the probability of all
+        the routes left out is 1 minus the sum of the returned probabilities.
+        """
+        routes = {}
+        stack = [((0,), 0, 1, 1.0)] # route so far, location, visited mask, probability
+        while stack:
+            route, location, mask, route_p = stack.pop()
+            for dest in np.flatnonzero(self.probs[location]):
+                dest = int(dest)
+                p = route_p * self.probs[location, dest]
+                if p < min_probability:
+                    continue
+                new_mask = mask | (1 << dest)
+                if dest == 0:
+                    routes[route + (0,)] = p
+                elif new_mask == self.all_visited_mask:
+                    routes[route + (dest, 0)] = p
+                else:
+                    stack.append((route + (dest,), dest, new_mask, p))
+        return routes
+
+
+def analyse_bout(transition_probability_matrix, distance_matrix):
+    """Returns exact expectations (see BoutChain.analyse) of a bout with the given matrices
+    """
+    return BoutChain(transition_probability_matrix, distance_matrix).analyse()
+
+def analyse_bee(bee):
+    """Returns exact expectations (see BoutChain.analyse) of the given singleBee.Bee's next bout
+    """
+    return analyse_bout(bee.transition_probability_matrix, bee.distance_matrix)
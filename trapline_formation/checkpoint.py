@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for checkpointing long simulations, so a crashed or stopped simulation can be
+resumed where it left off. Used by both the trapline and the waggle dance hive
+simulations. A snapshot is the whole simulation state, including the random number
+generator, pickled and compressed into a single file. The state is pickled on the
+simulating thread (so it can't change while being saved), but compressing and writing
+it happen on a background thread, so the simulation carries on meanwhile. Resuming
+from a snapshot gives bit-identical results to never stopping.
+
+Only load checkpoints you wrote yourself: unpickling can run arbitrary code.
+
+@author: tp275
+"""
+import os
+import pickle
+import queue
+import threading
+import zlib
+
+class Checkpointer:
+    """
+    Saves snapshots of a simulation's state to path, every 'every' steps (bouts, runs or
+    timesteps, depending on the simulation), overwriting the previous snapshot.
+    If a snapshot is still being written when the next is saved, the simulation doesn't
+    wait: the pending snapshot is just replaced by the newer one.
+    """
+    def __init__(self, path, every=10):
+        self.path = path
+        self.every = every
+        self.pending = queue.Queue(maxsize=1) # pickled snapshot waiting to be written
+        self.error = None # exception raised by the background thread, if any
+        self.thread = threading.Thread(target=self.write_snapshots, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_due(self, step):
+        """Returns whether a snapshot should be saved after the given (1-based) step
+        """
+        return step % self.every == 0
+
+    def load(self):
+        """Returns the state in the last snapshot saved to path, or None if there isn't one
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            return pickle.loads(zlib.decompress(f.read()))
+
+    def save(self, state):
+        """Takes a snapshot of state (a dictionary) and queues it to be written
+        """
+        if self.error is not None:
+            raise self.error
+        snapshot = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        while True:
+            try:
+                self.pending.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try: # replace the older snapshot that hasn't started being written
+                    self.pending.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def write_snapshots(self):
+        """Background thread: writes each queued snapshot, until given None
+        """
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                return
+            try:
+                # write to a temporary file first, so a crash mid-write keeps the last snapshot
+                temporary_path = self.path + ".tmp"
+                with open(temporary_path, "wb") as f:
+                    f.write(zlib.compress(snapshot, 1))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporary_path, self.path)
+            except OSError as e:
+                self.error = e
+
+    def close(self):
+        """Waits for any queued snapshot to be written, then stops the background thread
+        """
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def remove(self):
+        """Deletes the snapshot, e.g. once the simulation has finished
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
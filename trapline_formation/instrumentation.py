@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module containing opt-in instrumentation for the main simulation loop: counters,
+per-phase timers and hooks, to find out why a run is slow (many incomplete bouts,
+long bouts, or time spent updating the probability matrix).
+When no instrumentation is passed to the loop, it costs one 'is None' check per bout.
+
+@author: tp275
+"""
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+class Instrumentation:
+    """
+    Counters, timers and hooks for navigationSimulation.simulate_run.
+    Hooks are callbacks for these events, called with the given arguments:
+        "run_start" (bee), "bout_end" (bee, complete_run),
+        "probability_update" (bee, prob_enhancement_factor), "run_end" (bee, distances)
+    """
+    def __init__(self):
+        self.counters = Counter() # bouts, moves, early_returns, probability_updates, runs
+        self.timers = Counter() # total seconds spent in each phase
+        self.hooks = defaultdict(list)
+
+    def add_hook(self, event, callback):
+        """Registers a callback to be called at every occurrence of the given event
+        """
+        self.hooks[event].append(callback)
+
+    def call_hooks(self, event, *args):
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    @contextmanager
+    def timer(self, phase):
+        """Context manager adding the time spent inside it to the given phase's timer
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[phase] += time.perf_counter() - start
+
+    def add_time(self, phase, seconds):
+        self.timers[phase] += seconds
+
+    def start_run(self, bee):
+        self.counters["runs"] += 1
+        self.call_hooks("run_start", bee)
+
+    def end_bout(self, bee, complete_run):
+        """Counts a finished bout, its moves (including any return to the nest) and whether it was complete
+        """
+        self.counters["bouts"] += 1
+        self.counters["moves"] += len(bee.visited_locations) - 1
+        if not complete_run:
+            self.counters["early_returns"] += 1
+        self.call_hooks("bout_end", bee, complete_run)
+
+    def update_probabilities(self, bee, prob_enhancement_factor):
+        """Updates the bee's probability matrix, timing and counting the update
+        """
+        with self.timer("update_probability_matrix"):
+            bee.update_probability_matrix(prob_enhancement_factor)
+        self.counters["probability_updates"] += 1
+        self.call_hooks("probability_update", bee, prob_enhancement_factor)
+
+    def end_run(self, bee, distances):
+        self.call_hooks("run_end", bee, distances)
+
+    def summary(self):
+        """Returns a dictionary of the counters, timers and rates derived from them
+        """
+        bouts = self.counters["bouts"]
+        return {"counters": dict(self.counters),
+                "timers": dict(self.timers),
+                "early_return_rate": self.counters["early_returns"]/bouts if bouts else 0.0,
+                "moves_per_bout": self.counters["moves"]/bouts if bouts else 0.0}
@@ -10,10 +10,20 @@ Multi-Destination Routes over Large Spatial Scales’ (Lihoreau et al., 2012)
 @author: tp275
 """
 import singleBee
+import beeBatch
+import routeTable
+import streamingStats
+import resultStore
+import instrumentation
+import runExecutor
+import checkpoint
 import math
+import time
+from collections import Counter
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import stats
+# matplotlib and scipy are slow to import, so they are only imported by the
+# __main__ blocks below when plots or t-tests are wanted, keeping worker processes
+# (and anything else importing this module) quick to start
 
 ########## PARAMETERS ##########
         
@@ -26,6 +36,16 @@ set_2013_probs = False # toggles whether initial probabilities use distance
 novelty_extension = False # toggles smaller enhancement factor for duplicate bouts
 swap_point = 50 # roughly how many duplicates it takes to start decreasing probability
 
+use_batch_engine = False # toggles simulating all runs at once (see beeBatch.py)
+parallel_workers = 0 # if non-zero, number of processes to spread runs over (see runExecutor.py)
+seed = None # seed for parallel runs, which are then reproducible for any number of workers
+streaming_stats = False # toggles batched runs with online stats, keeping no routes (see streamingStats.py)
+results_path = None # if set, a directory that per-bout results are saved to (see resultStore.py)
+reuse_results = False # toggles analysing the results saved in results_path, instead of simulating
+instrument = False # toggles counters and timers in the per-bee main loop (see instrumentation.py)
+checkpoint_path = None # if set, a file the state is saved to periodically, and resumed from (see checkpoint.py)
+checkpoint_every = 10 # bouts between snapshots for batched runs, runs between snapshots for the per-bee loop
+
 plot_run_graphs = False # [bout, distance] graph of each run
 print_average_distances = True
 plot_average_distance_graph = False
@@ -35,60 +55,289 @@ bins = int(bouts/10*2)
 
 ########## MAIN LOOP ##########
 
-if __name__ == "__main__":
-    av_distances = [[] for i in range(5)] # holds the average distances of slices of each run
-    locations_all_runs = [[] for i in range(runs)] # holds list of locations in each bout for each run
-    
-    for r in range(runs):
-        if (r+1) % 100 == 0:
-            print("\n**********\nRun " + str(r+1) + "\n**********")
-        bee = singleBee.Bee(set_2013_probs) # create bee
-        distances = [] # holds total distance covered in each bout
-   
-        b = 0
-        while b < bouts:
-            complete_run = True # set false when bee returns w/o visiting all flowers
-
-            # reset all location records with bee in nest, also transition record
-            bee.location = 0
-            bee.unique_visited_locations = set([0])
-            bee.visited_locations = [0]
-            bee.reset_transition_matrix()
-            
-            # bee movement loops while it hasn't visited all locations
-            while len(bee.unique_visited_locations) < 6:
-                bee.move()
-                # if bee returns to nest before this, end and mark bout as incomplete
-                if bee.location == 0:
-                    complete_run = False
-                    break
-                
-            # if bee visited all locations, return to nest:
-            if complete_run: 
-                bee.transition_recording_matrix[bee.location][0] += 1
-                bee.visited_locations.append(0)
-            
-            # could set bouts to increment only if run is complete (indent all below)
-            b += 1
-            locations_all_runs[r].append(bee.visited_locations)
-            
-            # append summed distance of bout to list
-            distances.append(bee.get_total_distance())
+def simulate_run(bouts=bouts, prob_enhancement_factor=prob_enhancement_factor,
+                 set_2013_probs=set_2013_probs, novelty_extension=novelty_extension,
+                 swap_point=swap_point, rng=None, route_table=None, stats=None,
+                 distance_matrix=None, writer=None, instrumentation=None):
+    """
+    Simulates one run: a single bee completing all of its bouts.
+    Returns the total distance of each bout, an array of the route ID of each bout and
+    the RouteTable of those IDs (a new one, unless a table to share is given).
+    Pass a numpy Generator as rng to make the run reproducible, and a StreamingStats
+    (using the same route table) as stats to add each bout to it as it finishes.
+    Any layout of nest and flowers can be given as distance_matrix (see singleBee.Bee).
+    The run's per-bout results are also appended to writer, if given (a resultStore.ResultWriter),
+    and counted, timed and passed to hooks by instrumentation, if given (see instrumentation.py).
+    """
+    bee = singleBee.Bee(set_2013_probs, rng, distance_matrix) # create bee
+    route_table = routeTable.RouteTable() if route_table is None else route_table
+    distances = [] # holds total distance covered in each bout
+    route_ids = np.zeros(bouts, dtype=np.int32) # holds route ID of each bout
+    route_counts = Counter() # holds number of times each route ID was flown
+    complete_runs = [] # holds whether each bout was complete
+    updated = [] # holds whether each bout updated the probability matrix
+    if stats is not None:
+        stats.start_runs(1)
+    if instrumentation is not None:
+        instrumentation.start_run(bee)
+
+    b = 0
+    while b < bouts:
+        complete_run = True # set false when bee returns w/o visiting all flowers
+
+        if instrumentation is not None:
+            bout_start = time.perf_counter()
+
+        # reset all location records with bee in nest, also transition record
+        bee.start_bout()
+        
+        # bee movement loops while it hasn't visited all locations
+        while not bee.has_visited_all():
+            bee.move()
+            # if bee returns to nest before this, end and mark bout as incomplete
+            if bee.location == 0:
+                complete_run = False
+                break
             
-            # if distance is new shortest route
-            if bee.get_total_distance() <= bee.min_distance and complete_run:
-                # set new min distance
-                bee.min_distance = bee.get_total_distance()
-                # then update transition probabilities....
-               
-                ####### My extension #######
-                if novelty_extension:
-                    # prob. enhancement factor diminishes and goes negative pE = pE-(2*(copies/50))
-                    repeats = locations_all_runs[r].count(bee.visited_locations)
-                    bee.update_probability_matrix(prob_enhancement_factor-(1.1*(repeats/swap_point)))
-                else:
-                    bee.update_probability_matrix(prob_enhancement_factor)
+        # if bee visited all locations, return to nest:
+        if complete_run: 
+            bee.return_to_nest()
+
+        if instrumentation is not None:
+            instrumentation.add_time("moving", time.perf_counter()-bout_start)
+            instrumentation.end_bout(bee, complete_run)
+        
+        route_id = route_table.intern(bee.visited_locations)
+        route_ids[b] = route_id
+        route_counts[route_id] += 1
+
+        complete_runs.append(complete_run)
+        updated.append(False)
+
+        # could set bouts to increment only if run is complete (indent all below)
+        b += 1
+        
+        # append summed distance of bout to list
+        distances.append(bee.bout_distance)
+        if stats is not None:
+            stats.add_bout(distances[-1:], route_ids[b-1:b])
+        
+        # if distance is new shortest route
+        if bee.bout_distance <= bee.min_distance and complete_run:
+            # set new min distance
+            bee.min_distance = bee.bout_distance
+            updated[-1] = True
+            # then update transition probabilities....
+           
+            ####### My extension #######
+            if novelty_extension:
+                # prob. enhancement factor diminishes and goes negative pE = pE-(2*(copies/50))
+                repeats = route_counts[route_id]
+                factor = prob_enhancement_factor-(1.1*(repeats/swap_point))
+            else:
+                factor = prob_enhancement_factor
+            if instrumentation is not None:
+                instrumentation.update_probabilities(bee, factor)
+            else:
+                bee.update_probability_matrix(factor)
+
+    if stats is not None:
+        stats.end_runs()
+    if writer is not None:
+        writer.add_runs([distances], [complete_runs], [route_ids], [updated])
+    if instrumentation is not None:
+        instrumentation.end_run(bee, distances)
+    return distances, route_ids, route_table
+
+
+def summarise_runs(distances_all_runs, route_ids_all_runs, route_table):
+    """
+    Interprets the bout distances and route IDs of a number of runs.
+    Returns a dictionary holding, per run, av_distances (the average distances of slices
+    of each run), bouts_to_optimum and bouts_to_stable_optimum (only for runs that
+    reached them) and unique_list (the number of unique bouts in each run)
+    """
+    av_distances = [[] for i in range(5)] # holds the average distances of slices of each run
+    for distances in distances_all_runs:
+        b_h = int(len(distances)/2) # int, == half the amount of bouts
+        b_q = int(len(distances)/4) # int, == quarter the amount of bouts
+        # append mean distance of this run,
+        # and of certain chunks/slices of this run, to a list of lists
+        av_distances[0].append(np.mean(distances))
+        av_distances[1].append(np.mean(distances[:b_q])) # 1st quarter
+#        av_distances[2].append(np.mean(distances[b_q:b_h]))
+#        av_distances[3].append(np.mean(distances[b_h:(b_q)*3]))
+        av_distances[4].append(np.mean(distances[(b_q)*3:])) # 4th quarter
+
+    ## interpret optimum and unique run data ##
+    optimum_a, optimum_b = [route_table.lookup(route) for route in routeTable.OPTIMAL_ROUTES]
+    optimal = [route_id for route_id in (optimum_a, optimum_b) if route_id >= 0]
+    bouts_to_optimum = []
+    bouts_to_stable_optimum = []
+    unique_list = []
+    for run in route_ids_all_runs:
+        run = np.asarray(run)
+        # bouts to first optimum
+        if optimum_a >= 0 and np.any(run == optimum_a):
+            bouts_to_optimum.append(int(np.argmax(run == optimum_a))+1)
+        elif optimum_b >= 0 and np.any(run == optimum_b):
+            bouts_to_optimum.append(int(np.argmax(run == optimum_b))+1)
+#        else:
+#            bouts_to_optimum.append(math.nan)
+        
+        # number of unique bouts in a run
+        unique_list.append(len(np.unique(run)))
+        
+        # bouts to stable optimum: three identical optimal bouts in a row
+        stable = (run[2:] == run[1:-1]) & (run[2:] == run[:-2]) & np.isin(run[2:], optimal)
+        if np.any(stable):
+            bouts_to_stable_optimum.append(int(np.argmax(stable))+1)
+#        else:
+#            bouts_to_stable_optimum.append(math.nan)
+
+    return {"av_distances": av_distances,
+            "bouts_to_optimum": bouts_to_optimum,
+            "bouts_to_stable_optimum": bouts_to_stable_optimum,
+            "unique_list": unique_list}
+
+
+def merge_summaries(summaries):
+    """Merges summaries of consecutive groups of runs into one summary of all the runs
+    """
+    merged = {"av_distances": [[] for i in range(5)],
+              "bouts_to_optimum": [],
+              "bouts_to_stable_optimum": [],
+              "unique_list": []}
+    for summary in summaries:
+        for i in range(5):
+            merged["av_distances"][i].extend(summary["av_distances"][i])
+        for key in ("bouts_to_optimum", "bouts_to_stable_optimum", "unique_list"):
+            merged[key].extend(summary[key])
+    return merged
+
+
+if __name__ == "__main__" and (checkpoint_path and (results_path or parallel_workers)):
+    raise ValueError("checkpointing isn't supported with results_path or parallel_workers")
+if __name__ == "__main__" and results_path and (streaming_stats or (parallel_workers and not reuse_results)):
+    # neither writes per-bout results, so a later reuse_results would find nothing saved
+    raise ValueError("results_path isn't supported with streaming_stats or parallel_workers")
+
+if __name__ == "__main__" and streaming_stats:
+    # statistics are updated as each bout finishes, so memory doesn't grow with runs
+    route_table = routeTable.RouteTable()
+    stats = streamingStats.StreamingStats(bouts, route_table, bins)
+    checkpointer = checkpoint.Checkpointer(checkpoint_path, checkpoint_every) if checkpoint_path else None
+    beeBatch.simulate(runs, bouts, prob_enhancement_factor, set_2013_probs,
+                      novelty_extension, swap_point, route_table=route_table,
+                      stats=stats, record=False, checkpointer=checkpointer)
+    if checkpointer is not None:
+        checkpointer.remove() # finished, so the next simulation starts afresh
+    summary = stats.summary()
+
+    print("Mean distance in all runs: " + str(summary["av_distance"]["mean"]))
+    print("Mean 1st quarter distance in all runs: " + str(summary["av_distance_first_quarter"]["mean"]))
+    print("Mean 4th quarter distance in all runs: " + str(summary["av_distance_last_quarter"]["mean"]))
+    print()
+    print("Median distance in all runs (estimate): " + str(summary["av_distance"]["median"]))
+    print("Median 1st quarter distance in all runs (estimate): " + str(summary["av_distance_first_quarter"]["median"]))
+    print("Median 4th quarter distance in all runs (estimate): " + str(summary["av_distance_last_quarter"]["median"]))
+    print()
+    print("Number of runs that reached the optimum: "
+          + str(summary["runs_reaching_optimum"]) + "/" + str(summary["runs"]))
+    print("\nMean bouts to first optimum: " + str(summary["bouts_to_optimum"]["mean"]))
+    print("\nMean bouts to stable optimum: " + str(summary["bouts_to_stable_optimum"]["mean"]))
+    print("\nMean number of unique bouts: " + str(summary["unique_bouts"]["mean"]))
+
+    if plot_histograms:
+        import matplotlib.pyplot as plt
+        for key, title in (("bouts_to_optimum", "Bouts to first optimum"),
+                           ("bouts_to_stable_optimum", "Bouts to stable optimum"),
+                           ("unique_bouts", "Number of unique bouts in a run")):
+            plt.title(title)
+            plt.xlabel("Number of bouts")
+            plt.ylabel("Runs")
+            plt.xlim(0,bouts)
+            plt.stairs(*summary[key]["histogram"], fill=True)
+            plt.show()
+            plt.clf()
+
+elif __name__ == "__main__":
+    if plot_run_graphs or plot_average_distance_graph or plot_histograms:
+        import matplotlib.pyplot as plt
+    # per-bout results are saved by the serial and batched engines, if results_path is set
+    writer = None
+    if results_path and not reuse_results and not parallel_workers:
+        writer = resultStore.ResultWriter(results_path, bouts, {
+                "prob_enhancement_factor": prob_enhancement_factor,
+                "set_2013_probs": set_2013_probs, "novelty_extension": novelty_extension,
+                "swap_point": swap_point, "use_batch_engine": use_batch_engine})
+
+    if reuse_results:
+        # read saved results back as memory-mapped (runs, bouts) arrays
+        saved = resultStore.ResultReader(results_path)
+        runs = saved.runs
+        distances_all_runs, route_ids_all_runs = saved.distance, saved.route_id
+        route_table = saved.get_route_table()
+    elif parallel_workers:
+        # spread runs across processes, each run seeded from its own SeedSequence
+        distances_all_runs, route_ids_all_runs, route_table, summary = runExecutor.run_parallel(
+                runs, bouts, prob_enhancement_factor, set_2013_probs,
+                novelty_extension, swap_point, seed, parallel_workers)
+    elif use_batch_engine:
+        # simulate all runs at once, as stacked arrays
+        checkpointer = checkpoint.Checkpointer(checkpoint_path, checkpoint_every) if checkpoint_path else None
+        distances_all_runs, route_ids_all_runs, route_table = beeBatch.simulate(
+                runs, bouts, prob_enhancement_factor, set_2013_probs,
+                novelty_extension, swap_point, writer=writer, checkpointer=checkpointer)
+        if checkpointer is not None:
+            checkpointer.remove() # finished, so the next simulation starts afresh
+    else:
+        distances_all_runs = [] # holds list of bout distances for each run
+        route_ids_all_runs = np.zeros((runs, bouts), dtype=np.int32) # holds route ID of each bout for each run
+        route_table = routeTable.RouteTable() # holds the route of each route ID
+        run_instrumentation = instrumentation.Instrumentation() if instrument else None
+        rng = None # each bee gets its own unseeded generator, unless checkpointing
+        first_run = 0
+        if checkpoint_path:
+            # all bees share one generator, so its state can be saved between runs
+            rng = np.random.default_rng(seed)
+            checkpointer = checkpoint.Checkpointer(checkpoint_path, checkpoint_every)
+            parameters = [runs, bouts, prob_enhancement_factor, set_2013_probs,
+                          novelty_extension, swap_point]
+            resumed = checkpointer.load()
+            if resumed is not None:
+                if resumed["parameters"] != parameters:
+                    raise ValueError("checkpoint " + checkpoint_path
+                                     + " is of a simulation with different parameters")
+                first_run = resumed["run"]
+                distances_all_runs = resumed["distances_all_runs"]
+                route_ids_all_runs = resumed["route_ids_all_runs"]
+                route_table = resumed["route_table"]
+                rng.bit_generator.state = resumed["rng_state"]
+        for r in range(first_run, runs):
+            if (r+1) % 100 == 0:
+                print("\n**********\nRun " + str(r+1) + "\n**********")
+            distances, route_ids_all_runs[r], route_table = simulate_run(
+                    rng=rng, route_table=route_table, writer=writer,
+                    instrumentation=run_instrumentation)
+            distances_all_runs.append(distances)
+            if checkpoint_path and checkpointer.is_due(r+1):
+                checkpointer.save({"parameters": parameters, "run": r+1,
+                                   "distances_all_runs": distances_all_runs,
+                                   "route_ids_all_runs": route_ids_all_runs,
+                                   "route_table": route_table, "rng_state": rng.bit_generator.state})
+        if checkpoint_path:
+            checkpointer.remove() # finished, so the next simulation starts afresh
+        if instrument:
+            print(run_instrumentation.summary())
+
+    if writer is not None:
+        writer.close(route_table)
 
+    if reuse_results or not parallel_workers:
+        summary = summarise_runs(distances_all_runs, route_ids_all_runs, route_table)
+
+    for distances in distances_all_runs:
 
 ########## PLOTTING ##########
                 
@@ -108,18 +357,9 @@ if __name__ == "__main__":
             plt.show()
             plt.clf()
         
-    ## plot the run and run slice distance averages ##
-        if print_average_distances:  
-            b_h = int(bouts/2) # int, == half the amount of bouts
-            b_q = int(bouts/4) # int, == quarter the amount of bouts
-            # append mean distance of this run,
-            # and of certain chunks/slices of this run, to a list of lists
-            av_distances[0].append(np.mean(distances))
-            av_distances[1].append(np.mean(distances[:b_q])) # 1st quarter
-#            av_distances[2].append(np.mean(distances[b_q:b_h]))
-#            av_distances[3].append(np.mean(distances[b_h:(b_q)*3]))
-            av_distances[4].append(np.mean(distances[(b_q)*3:])) # 4th quarter
-            
+    ## the run and run slice distance averages ##
+    av_distances = summary["av_distances"]
+
     print("Mean distance in all runs: " + str(np.mean(av_distances[0])))
     print("Mean 1st quarter distance in all runs: " + str(np.mean(av_distances[1])))
     print("Mean 4th quarter distance in all runs: " + str(np.mean(av_distances[4])))
@@ -139,35 +379,13 @@ if __name__ == "__main__":
         plt.show()
         plt.clf()
     
-    ## interpret optimum and unique run data ##
-    bouts_to_optimum = []
-    bouts_to_stable_optimum = []
-    unique_list = []
-    for r, run in enumerate(locations_all_runs):
-        # bouts to first optimum
-        if [0,1,2,3,4,5,0] in run:
-            bouts_to_optimum.append(run.index([0,1,2,3,4,5,0])+1)
-        elif [0,5,4,3,2,1,0] in run:
-            bouts_to_optimum.append(run.index([0,5,4,3,2,1,0])+1)
-#        else:
-#            bouts_to_optimum.append(math.nan)
-        
-        # number of unique bouts in a run
-        unique_list.append(len(set(tuple(bout) for bout in run)))
-        
-        # bouts to stable optimum
-        stable = False
-        for b in range(2, len(locations_all_runs[r])):
-            if run[b] == run[b-1] and run[b] == run[b-2]:
-                if run[b] == [0,1,2,3,4,5,0] or run[b] == [0,5,4,3,2,1,0]:
-                    bouts_to_stable_optimum.append(b-1)
-                    stable = True
-                    break
-#        if not stable:
-#            bouts_to_stable_optimum.append(math.nan)
-    
+    bouts_to_optimum = summary["bouts_to_optimum"]
+    bouts_to_stable_optimum = summary["bouts_to_stable_optimum"]
+    unique_list = summary["unique_list"]
+
     ## plot histograms of optimum and unique run data ##
     if plot_histograms:
+        from scipy import stats
         print("Number of runs that reached the optimum: "
               + str(len(bouts_to_optimum)) + "/" + str(runs))
         
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for running the main simulation over a grid of parameter values,
+caching each point's results on disk so repeated or overlapping sweeps
+only simulate the points that are missing.
+
+@author: tp275
+"""
+import hashlib
+import itertools
+import json
+import os
+import numpy as np
+import navigationSimulation
+import runExecutor
+
+# bump this whenever a change to the model would change its results, invalidating the cache
+MODEL_VERSION = 1
+
+# the parameters that can be swept, with their defaults from the main simulation
+DEFAULT_PARAMETERS = {"prob_enhancement_factor": navigationSimulation.prob_enhancement_factor,
+                      "set_2013_probs": navigationSimulation.set_2013_probs,
+                      "novelty_extension": navigationSimulation.novelty_extension,
+                      "swap_point": navigationSimulation.swap_point}
+
+class ResultCache:
+    """
+    A directory of simulation results, one .npz file per key.
+    Least recently used files are deleted when the directory grows past max_bytes.
+    """
+    def __init__(self, cache_dir, max_bytes=1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, key):
+        """Returns the cached results for the given key as a dict of arrays, or None
+        """
+        path = self.get_path(key)
+        try:
+            with np.load(path) as data:
+                results = {name: data[name] for name in data.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path) # mark as recently used
+        return results
+
+    def save(self, key, results):
+        """Caches a dict of arrays under the given key, then evicts old results if needed
+        """
+        path = self.get_path(key)
+        temp_path = path + ".tmp.npz"
+        np.savez(temp_path, **results)
+        os.replace(temp_path, path) # so a half-written file is never loaded
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used results until the cache fits in max_bytes
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+
+
+def get_key(parameters, seed, runs, bouts):
+    """Returns a hash identifying the results of one sweep point
+    """
+    description = {"parameters": parameters, "seed": seed, "runs": runs, "bouts": bouts,
+                   "model_version": MODEL_VERSION}
+    # numpy values (e.g. from np.linspace grids) are hashed as their python equivalents
+    encoded = json.dumps(description, sort_keys=True, default=lambda value: value.item())
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def get_points(grid):
+    """
+    Returns every combination of the values in a grid (a dict of parameter name to
+    list of values), as a list of complete parameter dicts
+    """
+    for name in grid:
+        if name not in DEFAULT_PARAMETERS:
+            raise ValueError("Unknown parameter: " + str(name))
+    names = list(grid)
+    points = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        parameters = dict(DEFAULT_PARAMETERS)
+        parameters.update(zip(names, values))
+        points.append(parameters)
+    return points
+
+def simulate_point(parameters, seed, runs, bouts, workers=None):
+    """Simulates one sweep point, returning its results as a dict of arrays
+    """
+    distances, route_ids, route_table, summary = runExecutor.run_parallel(
+            runs, bouts, parameters["prob_enhancement_factor"], parameters["set_2013_probs"],
+            parameters["novelty_extension"], parameters["swap_point"], seed, workers,
+            return_routes=False)
+    return {"distances": np.array(distances),
+            "av_distances": np.array(summary["av_distances"][0]),
+            "av_distances_first_quarter": np.array(summary["av_distances"][1]),
+            "av_distances_last_quarter": np.array(summary["av_distances"][4]),
+            "bouts_to_optimum": np.array(summary["bouts_to_optimum"]),
+            "bouts_to_stable_optimum": np.array(summary["bouts_to_stable_optimum"]),
+            "unique_list": np.array(summary["unique_list"])}
+
+def sweep(grid, runs=navigationSimulation.runs, bouts=navigationSimulation.bouts, seed=0,
+          cache_dir="sweep_cache", max_cache_bytes=1024**3, workers=None):
+    """
+    Runs every point of a parameter grid, e.g. {"prob_enhancement_factor": [1.5, 2.5]}.
+    Parameters not in the grid keep their defaults. Points already in the cache (same
+    parameters, seed, runs, bouts and MODEL_VERSION) are loaded instead of simulated.
+    Returns a list of (parameters, results) pairs, results being a dict of arrays.
+    """
+    cache = ResultCache(cache_dir, max_cache_bytes)
+    results = []
+    for parameters in get_points(grid):
+        key = get_key(parameters, seed, runs, bouts)
+        point_results = cache.load(key)
+        if point_results is None:
+            point_results = simulate_point(parameters, seed, runs, bouts, workers)
+            cache.save(key, point_results)
+        results.append((parameters, point_results))
+    return results
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for splitting work into chunks to hand out across a pool of processes.
+Shared by the parallel runners of both simulations (runExecutor.py, and the waggle
+dance's hiveEnsemble.py), so it imports nothing but the standard library.
+
+@author: tp275
+"""
+import math
+import os
+
+def get_chunks(items, workers=None, chunk_size=None):
+    """
+    Splits a list of items into chunks of chunk_size, for a pool of (by default, one per
+    CPU) workers. By default there are about four chunks per worker, so a worker that
+    finishes early takes on another. Returns the number of workers and the list of chunks.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(len(items) / (workers*4)))
+    return workers, [items[i:i+chunk_size] for i in range(0, len(items), chunk_size)]
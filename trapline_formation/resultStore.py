@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for saving per-bout simulation results to disk, so analysis and plots can be
+re-run without re-simulating. Results are stored column by column, one raw binary
+file per column with runs as rows and bouts as columns, alongside a small JSON header.
+Reading them back uses np.memmap, so slicing never loads more than the slice.
+
+@author: tp275
+"""
+import json
+import os
+import numpy as np
+import routeTable
+
+# each column stored per bout, and its type
+COLUMNS = {"distance": np.float64, # total distance of the bout
+           "complete": np.bool_, # whether the bee visited every flower
+           "route_id": np.int32, # ID of the bout's route (see routes.json)
+           "updated": np.bool_} # whether the bout updated the probability matrix
+
+HEADER_FILE = "header.json"
+ROUTES_FILE = "routes.json"
+
+class ResultWriter:
+    """
+    Appends runs' per-bout results to the column files in a directory, a chunk of runs
+    at a time. The header (and route table) is written when the writer is closed.
+    """
+    def __init__(self, path, bouts, metadata=None):
+        self.path = path
+        self.bouts = bouts
+        self.metadata = {} if metadata is None else metadata
+        self.runs = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name in COLUMNS}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_runs(self, distances, complete, route_ids, updated):
+        """Appends a chunk of runs, each given as a (runs, bouts) array (or list of lists)
+        """
+        columns = {"distance": distances, "complete": complete,
+                   "route_id": route_ids, "updated": updated}
+        for name, values in columns.items():
+            values = np.asarray(values, dtype=COLUMNS[name]).reshape(-1, self.bouts)
+            values.tofile(self.files[name])
+        self.runs += len(values)
+
+    def close(self, route_table=None):
+        """Finishes the column files and writes the header and (if given) the route table
+        """
+        for f in self.files.values():
+            f.close()
+        header = {"runs": self.runs, "bouts": self.bouts,
+                  "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+                  "metadata": self.metadata}
+        with open(os.path.join(self.path, HEADER_FILE), "w") as f:
+            json.dump(header, f, indent=1)
+        if route_table is not None:
+            with open(os.path.join(self.path, ROUTES_FILE), "w") as f:
+                json.dump(route_table.routes, f)
+
+
+class ResultReader:
+    """
+    Reads results saved by a ResultWriter. Each column is a read-only (runs, bouts)
+    np.memmap attribute (distance, complete, route_id, updated), so rows and slices
+    are views onto the file rather than copies.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            self.header = json.load(f)
+        self.runs = self.header["runs"]
+        self.bouts = self.header["bouts"]
+        self.metadata = self.header["metadata"]
+        for name, dtype in self.header["columns"].items():
+            setattr(self, name, np.memmap(os.path.join(path, name + ".bin"), dtype=np.dtype(dtype),
+                                          mode="r", shape=(self.runs, self.bouts)))
+
+    def get_route_table(self):
+        """Returns the RouteTable of the stored route IDs
+        """
+        table = routeTable.RouteTable()
+        with open(os.path.join(self.path, ROUTES_FILE)) as f:
+            for route in json.load(f):
+                table.intern(route)
+        return table
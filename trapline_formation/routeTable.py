@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for storing routes (the list of locations visited in a bout) as integer IDs.
+Each distinct route is stored once in a RouteTable, so runs only need to keep
+a (runs, bouts) array of route IDs, and comparing routes is comparing integers.
+
+@author: tp275
+"""
+import numpy as np
+
+# the two shortest routes, one in each direction
+OPTIMAL_ROUTES = ([0,1,2,3,4,5,0], [0,5,4,3,2,1,0])
+
+def max_code_moves(num_locations):
+    """Returns the most moves a route between num_locations locations can have and still fit in a code
+    """
+    moves = 0
+    while num_locations**(moves+1) <= 2**62: # a leading 1 then the digits must fit in an int64
+        moves += 1
+    return moves
+
+def encode_route(route, num_locations):
+    """
+    Returns a route (starting at the nest) as a single integer: a leading 1, then each
+    location moved to as a base-num_locations digit. Codes of up to
+    max_code_moves(num_locations) moves fit in an int64.
+    """
+    code = 1
+    for location in route[1:]:
+        code = code*num_locations + location
+    return code
+
+def decode_route(code, num_locations):
+    """Returns the route (as a list of locations, from the nest) of a route code
+    """
+    locations = []
+    while code > 1:
+        code, location = divmod(code, num_locations)
+        locations.append(location)
+    locations.append(0)
+    return locations[::-1]
+
+
+class RouteTable:
+    """
+    An interning table of routes: gives each distinct route a small integer ID,
+    in the order the routes were first seen.
+    """
+    def __init__(self):
+        self.route_ids = {} # route tuple -> ID
+        self.routes = [] # ID -> route tuple
+        self.code_ids = {} # (number of locations, route code) -> ID, see intern_codes
+
+    def __len__(self):
+        return len(self.routes)
+
+    def intern(self, route):
+        """Returns the ID of the given route, adding it to the table if it is new
+        """
+        route = tuple(route)
+        route_id = self.route_ids.get(route)
+        if route_id is None:
+            route_id = len(self.routes)
+            self.route_ids[route] = route_id
+            self.routes.append(route)
+        return route_id
+
+    def intern_codes(self, codes, num_locations):
+        """
+        Returns an array of the IDs of an array of route codes (see encode_route), of
+        routes between num_locations locations. Only the distinct codes are looked up,
+        and only codes never seen before are decoded and interned.
+        """
+        unique_codes, inverse = np.unique(codes, return_inverse=True)
+        unique_ids = np.empty(len(unique_codes), dtype=np.int32)
+        for i, code in enumerate(unique_codes.tolist()):
+            route_id = self.code_ids.get((num_locations, code))
+            if route_id is None:
+                route_id = self.intern(decode_route(code, num_locations))
+                self.code_ids[(num_locations, code)] = route_id
+            unique_ids[i] = route_id
+        return unique_ids[inverse.ravel()]
+
+    def lookup(self, route):
+        """Returns the ID of the given route, or -1 if it has never been seen
+        """
+        return self.route_ids.get(tuple(route), -1)
+
+    def get_route(self, route_id):
+        """Returns the route with the given ID, as a list of locations
+        """
+        return list(self.routes[route_id])
+
+    def merge(self, other):
+        """
+        Adds all routes of another table to this one.
+        Returns an array mapping the other table's IDs to IDs in this table.
+        """
+        return np.array([self.intern(route) for route in other.routes], dtype=np.int32)
+
+
+class RouteCounts:
+    """
+    Counts of how many times each bee in a batch has flown each route, updated
+    incrementally every bout. The bee and route ID are packed into a single integer
+    key, and counts are kept in order of key, so each bout's counts are found with
+    one binary search for all bees, however many distinct routes each has flown.
+    """
+    def __init__(self, runs):
+        self.keys = np.zeros(0, dtype=np.int64) # sorted (bee index << 32) | route ID
+        self.counts = np.zeros(0, dtype=np.int32) # count of each key
+        self.bee_keys = np.arange(runs, dtype=np.int64) << 32 # each bee's part of the key
+        self.used = np.zeros(runs, dtype=int) # number of distinct routes flown by each bee
+
+    def add(self, route_ids):
+        """
+        Counts one more flight of the given route (one route ID per bee).
+        Returns how many times each bee has now flown its route, including this one.
+        """
+        keys = self.bee_keys | np.asarray(route_ids, dtype=np.int64)
+        positions = np.searchsorted(self.keys, keys)
+        found = positions < len(self.keys)
+        found[found] = self.keys[positions[found]] == keys[found]
+        counts = np.ones(len(keys), dtype=np.int32)
+        self.counts[positions[found]] += 1
+        counts[found] = self.counts[positions[found]]
+        new = ~found
+        if new.any():
+            # keys are already in order of bee, so the new keys are in order too
+            self.keys = np.insert(self.keys, positions[new], keys[new])
+            self.counts = np.insert(self.counts, positions[new], 1)
+            self.used += new
+        return counts
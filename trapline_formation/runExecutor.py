@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for running the main simulation's runs in parallel, across a pool of processes.
+Every run gets its own random generator, spawned from one SeedSequence, so results
+are identical whatever the number of workers or the size of the chunks of runs.
+
+@author: tp275
+"""
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import navigationSimulation
+import routeTable
+import poolChunks
+
+def run_chunk(run_seeds, bouts, prob_enhancement_factor, set_2013_probs,
+              novelty_extension, swap_point, return_routes=True):
+    """
+    Simulates one run for each of the given SeedSequences, in a worker process.
+    Returns the bout distances of each run, their route IDs, the chunk's RouteTable
+    of those IDs (or None for both, if return_routes is False) and their summary
+    """
+    distances_chunk = []
+    route_ids_chunk = np.zeros((len(run_seeds), bouts), dtype=np.int32)
+    route_table = routeTable.RouteTable()
+    for r, run_seed in enumerate(run_seeds):
+        distances, route_ids_chunk[r], route_table = navigationSimulation.simulate_run(
+                bouts, prob_enhancement_factor, set_2013_probs, novelty_extension,
+                swap_point, rng=np.random.default_rng(run_seed), route_table=route_table)
+        distances_chunk.append(distances)
+    summary = navigationSimulation.summarise_runs(distances_chunk, route_ids_chunk, route_table)
+    if not return_routes:
+        route_ids_chunk, route_table = None, None
+    return distances_chunk, route_ids_chunk, route_table, summary
+
+def run_parallel(runs, bouts, prob_enhancement_factor, set_2013_probs=False,
+                 novelty_extension=False, swap_point=50, seed=None, workers=None,
+                 chunk_size=None, return_routes=True):
+    """
+    Simulates the given number of runs across a pool of workers, handing them out in
+    chunks (see poolChunks.get_chunks for the defaults of workers and chunk_size).
+    Returns the bout distances of each run, a (runs, bouts) array of route IDs and the
+    RouteTable of those IDs (None for both if return_routes is False), and the merged
+    summary of all runs
+    """
+    run_seeds = np.random.SeedSequence(seed).spawn(runs)
+    workers, chunks = poolChunks.get_chunks(run_seeds, workers, chunk_size)
+
+    simulate_chunk = partial(run_chunk, bouts=bouts,
+                             prob_enhancement_factor=prob_enhancement_factor,
+                             set_2013_probs=set_2013_probs,
+                             novelty_extension=novelty_extension, swap_point=swap_point,
+                             return_routes=return_routes)
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(simulate_chunk, chunks)) # map keeps the runs in order
+
+    distances_all_runs = []
+    route_ids_all_runs = np.zeros((runs, bouts), dtype=np.int32) if return_routes else None
+    route_table = routeTable.RouteTable() if return_routes else None
+    start = 0
+    for distances_chunk, route_ids_chunk, chunk_table, summary in results:
+        distances_all_runs.extend(distances_chunk)
+        if return_routes:
+            # chunks were interned separately, so map their IDs into one shared table
+            route_ids_all_runs[start:start+len(distances_chunk)] = \
+                    route_table.merge(chunk_table)[route_ids_chunk]
+        start += len(distances_chunk)
+    summary = navigationSimulation.merge_summaries(result[3] for result in results)
+    return distances_all_runs, route_ids_all_runs, route_table, summary
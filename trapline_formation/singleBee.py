@@ -7,18 +7,79 @@ Module containing the bee class, used in the main simulation
 """
 import numpy as np
 import sys
-from sklearn.preprocessing import normalize
+from bisect import bisect_right
+
+class DestinationSampler:
+    """
+    Draws destinations from the rows of a probability matrix.
+    Keeps a precomputed cumulative table for each row, only rebuilding rows when told
+    they have changed, and draws from pre-generated blocks of uniform random numbers,
+    so each draw is a single binary search rather than a call to np.random.choice.
+    """
+    __slots__ = ("rng", "block_size", "uniforms", "next_uniform", "cumulative_tables")
+
+    def __init__(self, probability_matrix, rng=None, block_size=1024):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.block_size = block_size
+        self.uniforms = [] # current block of uniform random numbers
+        self.next_uniform = 0 # index of the next unused number in the block
+        self.cumulative_tables = [None] * len(probability_matrix)
+        self.update_rows(probability_matrix)
+
+    def update_rows(self, probability_matrix, rows=None):
+        """Rebuilds the cumulative tables of the given rows of the matrix (default all rows)
+        """
+        probs = np.asarray(probability_matrix, dtype=float)
+        rows = np.arange(len(probs)) if rows is None else np.asarray(rows, dtype=int)
+        probs = probs[rows]
+        if np.any(probs < 0):
+            raise ValueError("probabilities are not non-negative")
+        cdf = np.cumsum(probs, axis=1)
+        cdf /= cdf[:, -1:]
+        # a draw must never land past the last possible destination, even through rounding
+        last_possible = probs.shape[1] - 1 - np.argmax(probs[:, ::-1] > 0, axis=1)
+        cdf[np.arange(probs.shape[1]) >= last_possible[:, None]] = np.inf
+        for i, table in zip(rows.tolist(), cdf.tolist()):
+            self.cumulative_tables[i] = table
+
+    def draw(self, row):
+        """Returns a destination drawn from the probabilities of the given row
+        """
+        if self.next_uniform == len(self.uniforms):
+            self.uniforms = self.rng.random(self.block_size).tolist()
+            self.next_uniform = 0
+        u = self.uniforms[self.next_uniform]
+        self.next_uniform += 1
+        return bisect_right(self.cumulative_tables[row], u)
+
+
+def distance_matrix_from_coordinates(coordinates):
+    """
+    Returns the matrix of straight-line distances between locations given as an
+    (n, 2) array of x, y coordinates, with the nest first
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    differences = coordinates[:, None, :] - coordinates[None, :, :]
+    return np.sqrt(np.sum(differences**2, axis=2))
+
 
 class Bee:
     """
     A single bee, used in one run of the model.
     A neat way of storing useful variables and methods for use by the main loop.
+    Attributes are fixed by __slots__, making bees smaller and attribute access faster.
     """
-    def __init__(self, set_2013_probs):
+    __slots__ = ("distance_matrix", "transition_probability_matrix", "num_locations",
+                 "all_visited_mask", "sampler", "transition_recording_matrix", "transitions",
+                 "location", "visited_mask", "visited_locations", "bout_distance", "min_distance")
+
+    def __init__(self, set_2013_probs, rng=None, distance_matrix=None):
         """
         Matrix representing distances between sites.
         0     1        2   3   4   5
         nest, flower1, f2, f3, f4, f5
+        Any other layout (nest first, then any number of flowers) can be given as
+        distance_matrix instead, in which case the 2013 probabilities are always used.
         """
         self.distance_matrix = [[0,   50,  100, 120, 100, 50],
                                 [50,  0,   50,  80,  80,  50],
@@ -34,32 +95,71 @@ class Bee:
         Probabilities set as per Lihoreau 2012, with 0.1 for near and 0.6 for far.
         Same indexes as distance_matrix.
         """
-        self.transition_probability_matrix = [[0,   0.8, 0.0, 0.0, 0.0, 0.2],
-                                              [0.6, 0,   0.6, 0.1, 0.1, 0.6],
-                                              [0.1, 0.6, 0,   0.6, 0.1, 0.1],
-                                              [0.1, 0.1, 0.6, 0,   0.6, 0.1],
-                                              [0.1, 0.1, 0.1, 0.6, 0,   0.6],
-                                              [0.6, 0.6, 0.1, 0.1, 0.6, 0  ]]
-        self.normalize_probability_matrix()
-        
+        self.transition_probability_matrix = np.array([[0,   0.8, 0.0, 0.0, 0.0, 0.2],
+                                                       [0.6, 0,   0.6, 0.1, 0.1, 0.6],
+                                                       [0.1, 0.6, 0,   0.6, 0.1, 0.1],
+                                                       [0.1, 0.1, 0.6, 0,   0.6, 0.1],
+                                                       [0.1, 0.1, 0.1, 0.6, 0,   0.6],
+                                                       [0.6, 0.6, 0.1, 0.1, 0.6, 0  ]])
+
+        if distance_matrix is not None:
+            # the 2012 probabilities only exist for the layout above
+            self.distance_matrix = np.asarray(distance_matrix)
+            set_2013_probs = True
+        self.num_locations = len(self.distance_matrix)
+
+        # bitmask with a bit set for every location, i.e. all locations visited
+        self.all_visited_mask = (1 << self.num_locations) - 1
+
+        self.sampler = None
         if set_2013_probs:
             self.set_distance_style_probabilities()
+        else:
+            self.normalize_probability_matrix()
 
-        # A 6*6 matrix to record each transition between locations
-        self.transition_recording_matrix = []
-        self.reset_transition_matrix()
+        # draws destinations from the probability matrix, optionally using a seeded rng
+        self.sampler = DestinationSampler(self.transition_probability_matrix, rng)
+
+        # An n*n matrix to record each transition between locations,
+        # plus a list of the (from, to) transitions recorded in it this bout
+        self.transition_recording_matrix = np.zeros((self.num_locations, self.num_locations),
+                                                    dtype=int)
+        self.transitions = []
 
         # the bee's current location
         self.location = 0
 
-        # set of unique visited locations
-        self.unique_visited_locations = set([])
+        # bitmask of unique visited locations (bit i set when location i has been visited)
+        self.visited_mask = 0
         
         # list of all visited locations in order
         self.visited_locations = []
+
+        # total distance of the transitions made so far this bout
+        self.bout_distance = 0
         
         # the current minimum total bout distance found in this run
         self.min_distance = sys.maxsize
+
+    @classmethod
+    def from_coordinates(cls, coordinates, rng=None):
+        """Creates a bee for a layout given as an (n, 2) array of coordinates, nest first
+        """
+        return cls(True, rng, distance_matrix_from_coordinates(coordinates))
+
+    def start_bout(self):
+        """Resets all location records with the bee in the nest, also the transition record
+        """
+        self.location = 0
+        self.visited_mask = 1
+        self.visited_locations = [0]
+        self.bout_distance = 0
+        self.reset_transition_matrix()
+
+    def has_visited_all(self):
+        """Returns whether the bee has visited every location this bout
+        """
+        return self.visited_mask == self.all_visited_mask
         
     def move(self):
         """Undertakes one location-to-location move of the bee
@@ -67,20 +167,30 @@ class Bee:
         # calculate the bee's next location
         dest = self.get_destination()
         
-        # record the transition
+        # record the transition, and the distance covered
         self.transition_recording_matrix[self.location][dest] += 1
+        self.transitions.append((self.location, dest))
+        self.bout_distance += self.distance_matrix[self.location][dest]
         
         # update the bee's location
         self.location = dest
         
-        # add the new location to location lists
-        self.unique_visited_locations.add(self.location)
+        # add the new location to location records
+        self.visited_mask |= 1 << dest
         self.visited_locations.append(self.location)
+
+    def return_to_nest(self):
+        """Records the bee's final transition back to the nest, after visiting every location
+        """
+        self.transition_recording_matrix[self.location][0] += 1
+        self.transitions.append((self.location, 0))
+        self.bout_distance += self.distance_matrix[self.location][0]
+        self.visited_locations.append(0)
       
     def get_destination(self):
         """Returns the next location for the bee, calculated using the probability matrix
         """
-        return np.random.choice([0,1,2,3,4,5], p=self.transition_probability_matrix[self.location])
+        return self.sampler.draw(self.location)
         # when enabled, the following disallows choosing the previous location:
 #        if len(self.visited_locations) > 1:
 #            while choice == self.visited_locations[-2]:
@@ -89,31 +199,49 @@ class Bee:
         
     def get_total_distance(self):
         """Returns the summed distance of all transitions currently stored
+        (bout_distance holds the same total, accumulated move by move)
         """
         return np.sum(np.multiply(self.distance_matrix, self.transition_recording_matrix))
     
     def reset_transition_matrix(self):
-        """Sets the transiton recording matrix to all zeros
         """
-        self.transition_recording_matrix = np.zeros((6,6), dtype=int)
+        Sets the transiton recording matrix to all zeros.
+        Only the transitions recorded since the last reset are cleared, so this
+        takes time proportional to the moves made, not the size of the matrix.
+        """
+        for i, j in self.transitions:
+            self.transition_recording_matrix[i][j] = 0
+        self.transitions = []
     
-    def normalize_probability_matrix(self):
-        """Goes through each row of the probability matrix and normalizes the values (0-1)
+    def normalize_probability_matrix(self, rows=None):
+        """
+        Goes through each row (or the given rows) of the probability matrix and normalizes
+        the values (0-1), in place. Rows of all zeros are left as they are.
         """
-        self.transition_probability_matrix = normalize(self.transition_probability_matrix,
-                                                       axis=1, norm='l1')
+        if rows is None:
+            probs = self.transition_probability_matrix
+        else:
+            probs = self.transition_probability_matrix[rows]
+        row_sums = np.sum(np.abs(probs), axis=1, keepdims=True)
+        row_sums[row_sums == 0] = 1
+        probs /= row_sums
+        if rows is not None:
+            self.transition_probability_matrix[rows] = probs
                                                        
     def update_probability_matrix(self, prob_enhancement_factor):
         """
         Updates the probability matrix, heightening probabilities of the transitions
         in the bout currently stored in the transition_recording_matrix by a given factor
         """
-        # create a matrix to multiply the probability matrix with
-        mult_mat = np.multiply(self.transition_recording_matrix, prob_enhancement_factor)
+        # only the rows of locations the bee moved from change
+        rows = np.unique([i for i, j in self.transitions])
+        # create a matrix to multiply those rows of the probability matrix with
+        mult_mat = np.multiply(self.transition_recording_matrix[rows], prob_enhancement_factor)
         # make all 0s 1s, so probs remain the same when multiplied by this matrix
-        np.place(mult_mat, mult_mat == 0, 1)
-        self.transition_probability_matrix = np.multiply(self.transition_probability_matrix, mult_mat)
-        self.normalize_probability_matrix() # don't forget to normalize those probabilities!
+        mult_mat[mult_mat == 0] = 1
+        self.transition_probability_matrix[rows] *= mult_mat
+        self.normalize_probability_matrix(rows) # don't forget to normalize those probabilities!
+        self.sampler.update_rows(self.transition_probability_matrix, rows)
 
     def set_distance_style_probabilities(self):
         """
@@ -121,13 +249,10 @@ class Bee:
         Probabilities are inversely proportional to the squared distance between flowers,
         normalized with respect to all flowers.
         """
-        new_probs = np.copy(self.distance_matrix)
-        new_probs = np.power(new_probs, 2)
-        for i, row in enumerate(new_probs):
-            row_sum = sum(row)
-            for j in range(len(new_probs)):
-                if row[j] != 0:
-                    row[j] = row_sum - row[j]
-        self.transition_probability_matrix = new_probs
+        new_probs = np.power(np.asarray(self.distance_matrix), 2)
+        row_sums = np.sum(new_probs, axis=1, keepdims=True)
+        self.transition_probability_matrix = np.where(new_probs != 0, row_sums - new_probs,
+                                                      0).astype(float)
         self.normalize_probability_matrix()
-        
\ No newline at end of file
+        if self.sampler is not None:
+            self.sampler.update_rows(self.transition_probability_matrix)
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Intelligence in Animals and Machines, Assessment 3
+Module for gathering the main simulation's statistics as each bout finishes,
+rather than keeping every route of every run until the end.
+Memory used depends on the number of runs simulated at once, not the total.
+
+@author: tp275
+"""
+import math
+import numpy as np
+import routeTable
+
+class P2Median:
+    """
+    Running estimate of the median of a stream of values, using the P-squared
+    algorithm (Jain & Chlamtac, 1985): five markers, so constant memory.
+    """
+    def __init__(self):
+        self.heights = [] # marker heights
+        self.positions = [1, 2, 3, 4, 5] # actual marker positions
+        self.desired = [1, 2, 3, 4, 5] # desired marker positions
+        self.increments = [0, 0.25, 0.5, 0.75, 1]
+
+    def add(self, x):
+        """Adds a value to the stream
+        """
+        if len(self.heights) < 5:
+            self.heights.append(x)
+            self.heights.sort()
+            return
+        q = self.heights
+        # find the cell the value falls in, extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k+1]:
+                k += 1
+        for i in range(k+1, 5):
+            self.positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+        # adjust the middle markers if they are off their desired positions
+        n = self.positions
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1]-n[i] > 1) or (d <= -1 and n[i-1]-n[i] < -1):
+                d = int(math.copysign(1, d))
+                # piecewise parabolic prediction, falling back to linear
+                h = q[i] + d/(n[i+1]-n[i-1]) * ((n[i]-n[i-1]+d)*(q[i+1]-q[i])/(n[i+1]-n[i])
+                                                + (n[i+1]-n[i]-d)*(q[i]-q[i-1])/(n[i]-n[i-1]))
+                if not q[i-1] < h < q[i+1]:
+                    h = q[i] + d*(q[i+d]-q[i])/(n[i+d]-n[i])
+                q[i] = h
+                n[i] += d
+
+    def get_median(self):
+        """Returns the current estimate (exact for up to five values)
+        """
+        if not self.heights:
+            return math.nan
+        if len(self.heights) < 5:
+            return float(np.median(self.heights))
+        return self.heights[2]
+
+
+class RunningStats:
+    """
+    Running count, mean, variance and median estimate of a stream of values,
+    plus a histogram over a fixed range (values outside it are counted separately).
+    """
+    def __init__(self, hist_range, bins):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # sum of squared differences from the mean
+        self.median = P2Median()
+        self.hist_edges = np.linspace(hist_range[0], hist_range[1], bins+1)
+        self.hist_counts = np.zeros(bins, dtype=int)
+        self.below_range = 0
+        self.above_range = 0
+
+    def add(self, values):
+        """Adds an array of values to the stream
+        """
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        # merge the values' mean and variance in (Chan et al.'s parallel algorithm)
+        count = self.count + values.size
+        delta = values.mean() - self.mean
+        self.m2 += np.sum((values-values.mean())**2) + delta**2 * self.count*values.size/count
+        self.mean += delta * values.size/count
+        self.count = count
+        for x in values.tolist():
+            self.median.add(x)
+        self.hist_counts += np.histogram(values, self.hist_edges)[0]
+        self.below_range += int(np.sum(values < self.hist_edges[0]))
+        self.above_range += int(np.sum(values > self.hist_edges[-1]))
+
+    def get_std(self):
+        """Returns the sample standard deviation of the values so far
+        """
+        return math.sqrt(self.m2/(self.count-1)) if self.count > 1 else math.nan
+
+    def summary(self):
+        """Returns a dictionary of the statistics so far
+        """
+        return {"count": self.count,
+                "mean": self.mean if self.count else math.nan,
+                "std": self.get_std(),
+                "median": self.median.get_median(),
+                "histogram": (self.hist_counts.copy(), self.hist_edges.copy())}
+
+
+class StreamingStats:
+    """
+    Updates the statistics of summarise_runs in navigationSimulation online, one bout at a time.
+    Any number of runs can be simulated at once: call start_runs with how many, add_bout
+    with arrays of their distances and route IDs after every bout, then end_runs.
+    An optional sink is passed every bout's results too (e.g. a RouteLog, to keep them all).
+    """
+    def __init__(self, bouts, route_table, bins=50, distance_range=(0, 1500), sink=None):
+        self.bouts = bouts
+        self.b_q = int(bouts/4) # int, == quarter the amount of bouts
+        self.sink = sink
+        # intern the optimal routes up front, so they can be spotted by ID
+        self.optimum_a, self.optimum_b = [route_table.intern(route)
+                                          for route in routeTable.OPTIMAL_ROUTES]
+        self.runs = 0 # number of runs finished
+        self.runs_reaching_optimum = 0
+
+        # per-run results, accumulated over all runs
+        self.av_distance = RunningStats(distance_range, bins)
+        self.av_distance_first_quarter = RunningStats(distance_range, bins)
+        self.av_distance_last_quarter = RunningStats(distance_range, bins)
+        self.bouts_to_optimum = RunningStats((0, bouts), bins)
+        self.bouts_to_stable_optimum = RunningStats((0, bouts), bins)
+        self.unique_bouts = RunningStats((0, bouts), bins)
+        self.start_runs(0)
+
+    def start_runs(self, n):
+        """Resets the per-run state, ready for n runs to be simulated at once
+        """
+        self.bout = 0
+        self.distance_sums = np.zeros((3, n)) # whole run, 1st quarter, 4th quarter
+        self.first_a = np.full(n, -1) # first bout with each optimal route
+        self.first_b = np.full(n, -1)
+        self.stable = np.full(n, -1) # bouts to stable optimum
+        self.previous = np.full(n, -1) # previous route ID
+        self.streak = np.zeros(n, dtype=int) # number of identical routes in a row
+        self.route_counts = routeTable.RouteCounts(n)
+
+    def add_bout(self, distances, route_ids):
+        """Updates the per-run state with the distance and route ID of each run's latest bout
+        """
+        distances = np.asarray(distances)
+        route_ids = np.asarray(route_ids)
+        b = self.bout
+        self.distance_sums[0] += distances
+        if b < self.b_q:
+            self.distance_sums[1] += distances
+        if b >= self.b_q*3:
+            self.distance_sums[2] += distances
+
+        self.first_a[(self.first_a < 0) & (route_ids == self.optimum_a)] = b
+        self.first_b[(self.first_b < 0) & (route_ids == self.optimum_b)] = b
+
+        # three identical optimal bouts in a row
+        self.streak = np.where(route_ids == self.previous, self.streak+1, 1)
+        self.previous = route_ids
+        optimal = (route_ids == self.optimum_a) | (route_ids == self.optimum_b)
+        self.stable[(self.stable < 0) & (self.streak >= 3) & optimal] = b-1
+
+        self.route_counts.add(route_ids)
+        if self.sink is not None:
+            self.sink(self.runs, b, distances, route_ids)
+        self.bout += 1
+
+    def end_runs(self):
+        """Adds the results of the runs just finished to the accumulated statistics
+        """
+        b_q = self.b_q
+        self.av_distance.add(self.distance_sums[0]/self.bout)
+        self.av_distance_first_quarter.add(self.distance_sums[1]/b_q if b_q else [])
+        self.av_distance_last_quarter.add(self.distance_sums[2]/(self.bout-b_q*3))
+        # the first route in OPTIMAL_ROUTES takes precedence, as in summarise_runs
+        first = np.where(self.first_a >= 0, self.first_a, self.first_b)
+        reached = first >= 0
+        self.bouts_to_optimum.add(first[reached]+1)
+        self.bouts_to_stable_optimum.add(self.stable[self.stable >= 0])
+        self.unique_bouts.add(self.route_counts.used)
+        self.runs_reaching_optimum += int(np.sum(reached))
+        self.runs += len(first)
+        self.start_runs(0)
+
+    def summary(self):
+        """Returns a dictionary of the statistics of all runs so far
+        """
+        return {"runs": self.runs,
+                "runs_reaching_optimum": self.runs_reaching_optimum,
+                "av_distance": self.av_distance.summary(),
+                "av_distance_first_quarter": self.av_distance_first_quarter.summary(),
+                "av_distance_last_quarter": self.av_distance_last_quarter.summary(),
+                "bouts_to_optimum": self.bouts_to_optimum.summary(),
+                "bouts_to_stable_optimum": self.bouts_to_stable_optimum.summary(),
+                "unique_bouts": self.unique_bouts.summary()}
+
+
+class RouteLog:
+    """
+    A sink for StreamingStats that keeps every bout's distance and route ID,
+    in (runs, bouts) arrays, for when the full log is wanted after all.
+    """
+    def __init__(self, runs, bouts):
+        self.distances = np.zeros((runs, bouts))
+        self.route_ids = np.zeros((runs, bouts), dtype=np.int32)
+
+    def __call__(self, first_run, bout, distances, route_ids):
+        self.distances[first_run:first_run+len(distances), bout] = distances
+        self.route_ids[first_run:first_run+len(route_ids), bout] = route_ids
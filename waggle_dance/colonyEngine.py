@@ -0,0 +1,214 @@
+"""
+A vectorised alternative to hiveSim's list of Bee objects, for large colonies.
+The colony is stored as a struct of arrays (one element per bee) rather than an
+array of structs, and each timestep's idle/waggle/forage transitions are done as
+masked numpy operations, so a timestep costs a handful of array operations
+instead of a Python loop over every bee.
+
+The effects of hiveSim.timestep's sweep through the bees in order are kept: bees
+that stop dancing or come back with nothing can be recruited by dancers later in the
+sweep, and recruits later in the sweep than their dancer count down a foraging turn
+in the same timestep, so the colony follows the same model as hiveSim's loop.
+
+@author: tp275
+"""
+import numpy as np
+import siteIndex
+
+IDLE, WAGGLE, FORAGE = 0, 1, 2 # bee states, as in hiveSim.Bee
+
+class Colony:
+    """
+    A colony of bees, with each of hiveSim.Bee's variables held as an array over bees.
+    The bees' private directions are held as a (bees, sites) matrix of how many times
+    each bee has found each site, which is all random.choice of the direction list needs.
+    A dancer's site distance is passed on to its recruits along with its direction.
+    """
+    def __init__(self, num_bees, sites, rng=None, recruitment_probability=0.1,
+                 private_probability=0.1):
+        """
+        Creates a colony of idle bees, with the same few bees initially waggling as
+        hiveSim.create_bees. sites is either a dictionary of site direction: quality,
+        or a siteIndex.SiteIndex of patches at continuous angles and distances.
+        recruitment_probability is the chance of each dancer recruiting each idle bee,
+        and private_probability the chance of an arriving forager using its private
+        directions rather than its dancer's (both 0.1, as in hiveSim).
+        """
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.num_bees = num_bees
+        self.recruitment_probability = recruitment_probability
+        self.private_probability = private_probability
+        if isinstance(sites, siteIndex.SiteIndex):
+            self.site_index = sites
+            self.sites = range(len(sites)) # sites are referred to by index
+        else:
+            self.site_index = siteIndex.SiteIndex.from_sites(sites)
+            self.sites = sites
+        self.site_directions = self.site_index.angles
+        self.site_distances = self.site_index.distances
+        self.site_qualities = self.site_index.qualities
+
+        self.state = np.full(num_bees, IDLE, dtype=np.int8)
+        self.foragingTurns = np.zeros(num_bees, dtype=np.int8)
+        self.waggle_turns = np.zeros(num_bees) # float, as a site's quality/10
+        self.waggle_direction = np.zeros(num_bees)
+        self.waggle_distance = np.zeros(num_bees)
+        self.public_direction = np.zeros(num_bees)
+        self.public_distance = np.zeros(num_bees)
+        self.private_counts = np.zeros((num_bees, len(self.sites)), dtype=np.int32)
+
+        # set up some bees to be initially waggling, as in hiveSim.create_bees
+        for bee, waggle_turns, waggle_direction in ((0, 5, 90), (1, 1, 225),
+                                                    (2, 5, 90), (3, 1, 225)):
+            if bee < num_bees:
+                self.state[bee] = WAGGLE
+                self.waggle_turns[bee] = waggle_turns
+                self.waggle_direction[bee] = waggle_direction
+
+    def __len__(self):
+        return self.num_bees
+
+    def count_states(self):
+        """Returns the number of bees idle, waggle dancing and foraging
+        """
+        return tuple(int(np.count_nonzero(self.state == state)) for state in (IDLE, WAGGLE, FORAGE))
+
+    def get_site_indexes(self, directions, distances=None):
+        """
+        Returns the index (into sites) of the site at each direction (and distance, if given),
+        or -1 where there is none
+        """
+        return self.site_index.query(directions, distances)
+
+    def recruit(self, idle, dancers, newly_idle):
+        """
+        Recruits idle bees to foraging as hiveSim.timestep's sweep through the bees in
+        order does, each dancer recruiting each bee idle when the sweep reaches it with
+        probability recruitment_probability. Bees in idle, idle at the start of the
+        timestep, can be recruited by every dancer; bees in newly_idle, which stopped
+        dancing or found nothing this timestep, only by the dancers after them in the sweep.
+        A bee is recruited by the first of its dancers to succeed, independently of every
+        other bee, so this gives the same distribution of recruits as the sweep.
+        How many of idle are recruited is drawn from the binomial distribution, and that
+        many are sampled without replacement, so the random numbers drawn scale with the
+        recruits, not the idle bees. Each recruit's dancer is drawn from the truncated
+        geometric distribution of the first success.
+        A recruit after its dancer in the sweep counts down its first foraging turn
+        straight away, as the sweep reaches it later in the same timestep.
+        Returns the number of bees recruited.
+        """
+        if not dancers.size:
+            return 0
+        p_not_recruited = 1 - self.recruitment_probability # by each dancer
+        p_recruited = 1 - p_not_recruited**dancers.size # chance that at least one dancer recruits a bee
+        num_recruited = self.rng.binomial(idle.size, p_recruited)
+        if num_recruited <= idle.size // 2:
+            recruited = self.rng.choice(idle, num_recruited, replace=False)
+        else: # with many dancers, it's quicker to sample the bees left idle
+            recruited_mask = np.ones(idle.size, dtype=bool)
+            recruited_mask[self.rng.choice(idle.size, idle.size-num_recruited, replace=False)] = False
+            recruited = idle[recruited_mask]
+
+        # bees idle since earlier in the sweep can only be recruited by the dancers after them
+        first_dancer = np.searchsorted(dancers, newly_idle, side="right")
+        num_dancers = dancers.size - first_dancer
+        if p_not_recruited > 0: # 1 - p_not_recruited**num_dancers, but quicker for an array of powers
+            p_newly_recruited = -np.expm1(num_dancers * np.log(p_not_recruited))
+        else:
+            p_newly_recruited = (num_dancers > 0).astype(float)
+        newly_recruited = self.rng.random(newly_idle.size) < p_newly_recruited
+
+        recruits = np.concatenate((recruited, newly_idle[newly_recruited]))
+        if not recruits.size:
+            return 0
+        p_recruits = np.concatenate((np.full(recruited.size, p_recruited),
+                                     p_newly_recruited[newly_recruited]))
+        first_dancer = np.concatenate((np.zeros(recruited.size, dtype=np.int64),
+                                       first_dancer[newly_recruited]))
+        num_dancers = np.concatenate((np.full(recruited.size, dancers.size),
+                                      num_dancers[newly_recruited]))
+        # inverse transform sampling of the first successful dancer, given there was one
+        u = self.rng.random(recruits.size)
+        if p_not_recruited > 0:
+            first = np.floor(np.log1p(-u*p_recruits) / np.log(p_not_recruited)).astype(np.int64)
+            first = np.minimum(first, num_dancers-1)
+        else: # every dancer recruits every bee, so the first dancer gets them all
+            first = np.zeros(recruits.size, dtype=np.int64)
+        recruiters = dancers[first_dancer + first]
+        self.state[recruits] = FORAGE
+        self.foragingTurns[recruits] = 2 - (recruits > recruiters)
+        self.public_direction[recruits] = (self.waggle_direction[recruiters]
+                                           + self.rng.integers(-90, 90, recruits.size))
+        self.public_distance[recruits] = self.waggle_distance[recruiters]
+        return recruits.size
+
+    def choose_private_sites(self, bees):
+        """
+        Returns the index of the site each of the given bees goes to using its private
+        directions (-1 for none): a random one of its found sites, weighted by how often
+        it found each, or a random direction (0-359) if it hasn't found any.
+        """
+        counts = self.private_counts[bees]
+        totals = counts.sum(axis=1)
+        chosen = np.full(bees.size, -1)
+        remembers = totals > 0
+        if remembers.any():
+            cumulative = np.cumsum(counts[remembers], axis=1)
+            u = self.rng.random(cumulative.shape[0]) * totals[remembers]
+            chosen[remembers] = np.argmax(cumulative > u[:, None], axis=1)
+        forgets = ~remembers
+        chosen[forgets] = self.get_site_indexes(self.rng.integers(0, 360, np.count_nonzero(forgets)))
+        return chosen
+
+    def timestep(self, instrumentation=None, stats=None):
+        """
+        Performs one timestep's actions for every bee at once.
+        Returns a dictionary of sites:#bees that found that site this timestep.
+        If given, a hiveInstrumentation.HiveInstrumentation counts each state transition,
+        and the state transitions and site numbers are added to a hiveSim.BeeStats.
+        """
+        if instrumentation is not None:
+            instrumentation.start_timestep()
+        foraging = self.state == FORAGE
+        # foraging bees wait out their foraging turns, then go to a site
+        arriving_mask = foraging & (self.foragingTurns < 0)
+        self.foragingTurns -= foraging & ~arriving_mask
+        arriving = np.flatnonzero(arriving_mask)
+        idle = np.flatnonzero(self.state == IDLE)
+        dancers = np.flatnonzero(self.state == WAGGLE)
+
+        # waggle dancing bees dance one turn less, and those finished become idle
+        self.waggle_turns[dancers] -= 1
+        stopped = dancers[self.waggle_turns[dancers] <= 0]
+        self.state[stopped] = IDLE
+
+        use_public = self.rng.random(arriving.size) >= self.private_probability # as hiveSim.use_public_location
+        site_indexes = np.empty(arriving.size, dtype=np.int64)
+        public = arriving[use_public]
+        site_indexes[use_public] = self.get_site_indexes(self.public_direction[public],
+                                                         self.public_distance[public])
+        site_indexes[~use_public] = self.choose_private_sites(arriving[~use_public])
+
+        found = site_indexes >= 0
+        finders, found_sites = arriving[found], site_indexes[found]
+        self.state[finders] = WAGGLE
+        self.waggle_turns[finders] = self.site_qualities[found_sites] / 10
+        self.waggle_direction[finders] = self.site_directions[found_sites]
+        self.waggle_distance[finders] = self.site_distances[found_sites]
+        self.private_counts[finders, found_sites] += 1
+        self.state[arriving[~found]] = IDLE
+
+        # the dancers recruit idle bees, including those that became idle before them in the sweep
+        recruited = self.recruit(idle, dancers, np.sort(np.concatenate((stopped, arriving[~found]))))
+
+        if instrumentation is not None:
+            instrumentation.record_transition("recruited", recruited)
+            instrumentation.record_transition("stopped_dancing", stopped.size)
+            instrumentation.record_transition("found_site", finders.size)
+            instrumentation.record_transition("found_nothing", arriving.size-finders.size)
+            instrumentation.end_timestep(self)
+        site_counts = np.bincount(found_sites, minlength=len(self.sites))
+        if stats is not None:
+            stats.add_transitions(recruited, stopped.size, finders.size, arriving.size-finders.size)
+            stats.add_to_site_stats(site_counts)
+        return dict(zip(self.sites, site_counts.tolist()))
@@ -0,0 +1,180 @@
+"""
+Runs ensembles of independent colonies, to compare model parameters (such as how
+often foragers use their private rather than public information) over many repeats.
+Colonies are colonyEngine.Colony objects simulated across a pool of processes, each
+with its own random generator spawned from one SeedSequence, so results are the same
+whatever the number of workers. Workers write each colony's per-timestep state and site
+numbers straight into shared memory, so no results are pickled back, and ensemble
+means and quantiles are worked out over the whole shared array at once.
+
+@author: tp275
+"""
+import math
+import os
+import sys
+import numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import colonyEngine
+import hiveSim
+# colonies are split into chunks as the trapline simulation's runs are
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trapline_formation"))
+import poolChunks
+
+# the parameters that can differ between colonies, with their defaults from hiveSim
+DEFAULT_PARAMETERS = {"recruitment_probability": 0.1, # chance of a dancer recruiting an idle bee
+                      "private_probability": 0.1, # chance of a forager using its private directions
+                      "sites": hiveSim.sites}
+
+def open_block(name, shape, dtype):
+    """Returns the shared memory block of the given name, and an array of the given shape and dtype in it
+    """
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+class EnsembleResults:
+    """
+    The per-timestep numbers of an ensemble of colonies, in arrays in shared memory:
+        state_series, (parameter sets, repeats, timesteps+1, 3): bees idle, waggle dancing and foraging
+        site_series, (parameter sets, repeats, timesteps, sites): bees that found each site
+    close() (or leaving a with block) frees the shared memory, after which the arrays
+    can't be used, so copy anything needed for longer.
+    """
+    def __init__(self, parameters, repeats, timesteps):
+        self.parameters = parameters
+        self.repeats = repeats
+        self.timesteps = timesteps
+        # site qualities of each parameter set, for working out total qualities
+        self.site_qualities = np.array([hiveSim.get_site_qualities(p["sites"]) for p in parameters], dtype=float)
+        num_sites = self.site_qualities.shape[1]
+        self.blocks = []
+        self.layout = {} # series name: (shared memory name, shape, dtype), as workers need to open them
+        for name, shape, dtype in (("state_series", (len(parameters), repeats, timesteps+1, 3), np.int64),
+                                   ("site_series", (len(parameters), repeats, timesteps, num_sites), np.float64)):
+            size = max(1, math.prod(shape) * np.dtype(dtype).itemsize)
+            block = shared_memory.SharedMemory(create=True, size=size)
+            self.blocks.append(block)
+            self.layout[name] = (block.name, shape, dtype)
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_total_qualities(self):
+        """
+        Returns a (parameter sets, repeats, timesteps) array of the total site quality
+        found by each colony's foragers each timestep, as BeeStats.get_total_qualities
+        """
+        return np.einsum("srtk,sk->srt", self.site_series, self.site_qualities)
+
+    def get_means(self, series):
+        """
+        Returns the mean over repeats of a series (state_series, site_series or
+        get_total_qualities()), for each parameter set and timestep
+        """
+        return series.mean(axis=1)
+
+    def get_quantiles(self, series, quantiles=(0.1, 0.5, 0.9)):
+        """
+        Returns the given quantiles over repeats of a series, for each parameter set and
+        timestep, as an array with one more dimension, at the front, for the quantiles
+        """
+        return np.quantile(series, quantiles, axis=1)
+
+    def close(self):
+        """Frees the shared memory
+        """
+        self.state_series = None # no views of the blocks can be left when they close
+        self.site_series = None
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def run_colonies(colonies, layout, num_bees, timesteps):
+    """
+    Simulates each of the given (parameter set index, repeat, parameters, SeedSequence)
+    colonies, in a worker process, writing their numbers into the shared memory of layout
+    """
+    state_block = site_block = None
+    try:
+        state_block, state_series = open_block(*layout["state_series"])
+        site_block, site_series = open_block(*layout["site_series"])
+        for s, r, parameters, colony_seed in colonies:
+            colony = colonyEngine.Colony(num_bees, parameters["sites"], np.random.default_rng(colony_seed),
+                                         parameters["recruitment_probability"],
+                                         parameters["private_probability"])
+            # the colony's stats are kept in its part of the shared arrays
+            stats = hiveSim.BeeStats(timesteps, parameters["sites"], state_series[s, r], site_series[s, r])
+            stats.add_to_state_stats(colony)
+            for _ in range(timesteps):
+                colony.timestep(stats=stats)
+    finally:
+        stats = state_series = site_series = None # no views of the blocks can be left when they close
+        for block in (state_block, site_block):
+            if block is not None:
+                block.close()
+
+def run_ensemble(parameters, repeats, num_bees=500, timesteps=1000, seed=None, workers=None,
+                 chunk_size=None):
+    """
+    Simulates the given number of repeats of a colony of num_bees for each of the given
+    parameter sets (dictionaries of any of DEFAULT_PARAMETERS, the rest taking their
+    defaults), across a pool of workers, handing them out in chunks (see
+    poolChunks.get_chunks for the defaults of workers and chunk_size). Every parameter
+    set must have the same number of sites. Returns the ensemble's EnsembleResults.
+    """
+    parameters = [dict(DEFAULT_PARAMETERS, **p) for p in parameters]
+    if len({len(p["sites"]) for p in parameters}) > 1:
+        raise ValueError("every parameter set must have the same number of sites")
+    colony_seeds = np.random.SeedSequence(seed).spawn(len(parameters)*repeats)
+    colonies = [(s, r, p, colony_seeds[s*repeats + r])
+                for s, p in enumerate(parameters) for r in range(repeats)]
+    workers, chunks = poolChunks.get_chunks(colonies, workers, chunk_size)
+
+    results = EnsembleResults(parameters, repeats, timesteps)
+    simulate_chunk = partial(run_colonies, layout=results.layout, num_bees=num_bees, timesteps=timesteps)
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            for _ in pool.map(simulate_chunk, chunks): # raises any worker's exception
+                pass
+    except BaseException:
+        results.close()
+        raise
+    return results
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt # only needed for plotting, so workers don't import it
+
+    #####
+    private_probabilities = [0.0, 0.1, 0.5, 0.9] # chances of foragers using their private directions, to compare
+    repeats = 20 # colonies per private probability
+    num_bees = 500
+    timesteps = 1000
+    seed = None # seed for the ensemble, which is then reproducible for any number of workers
+    workers = None # processes to spread colonies over (None for one per CPU)
+    #####
+    parameters = [{"private_probability": p} for p in private_probabilities]
+    with run_ensemble(parameters, repeats, num_bees, timesteps, seed, workers) as results:
+        qualities = results.get_total_qualities()
+        mean_qualities = results.get_means(qualities)
+        low_qualities, high_qualities = results.get_quantiles(qualities, (0.1, 0.9))
+        mean_foraging = results.get_means(results.state_series[..., 2])
+        for s, p in enumerate(private_probabilities):
+            plt.plot(range(timesteps), mean_qualities[s], label="Private probability " + str(p))
+            plt.fill_between(range(timesteps), low_qualities[s], high_qualities[s], alpha=0.2)
+        plt.legend()
+        plt.title("Total quality (mean and 10-90% quantiles of " + str(repeats) + " colonies)")
+        plt.figure()
+        for s, p in enumerate(private_probabilities):
+            plt.plot(range(timesteps+1), mean_foraging[s], label="Private probability " + str(p))
+        plt.legend()
+        plt.title("Mean bees foraging")
+    plt.show()
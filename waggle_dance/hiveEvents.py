@@ -0,0 +1,132 @@
+"""
+An event-driven alternative to hiveSim.timestep's sweep over every bee.
+Most bees are idle (and only change state when recruited) or foraging (and only
+count down foragingTurns until they arrive somewhere), so instead of visiting every
+bee every timestep, a priority queue holds the timestep of each bee's next action:
+every timestep for a waggle dancer, and the arrival timestep for a forager.
+Each timestep only the bees with an action due are processed, so cost scales with
+dances, recruits and arrivals, not with the colony size.
+
+Bees are processed in the same order, and make the same random draws, as in
+hiveSim.timestep, so with the same random seed (and an IdleIndex kept across
+timesteps, see hiveSim.timestep) the per-timestep BeeStats series are identical.
+Every action is at most a few timesteps ahead, so the priority queue is a ring of
+per-timestep buckets of bee ids.
+
+It is chosen with HiveSimulation's use_event_scheduler (see hiveSim's __main__ for
+when it pays off). A forager's foragingTurns is only set when it arrives, rather
+than counted down.
+
+@author: tp275
+"""
+import hiveSim
+
+# the most timesteps between a bee's actions: a recruit before its dancer in the sweep
+# arrives at a site 4 timesteps after being recruited
+MAX_DELAY = 4
+
+class EventScheduler:
+    """
+    Steps a list of hiveSim.Bee objects (with bee_id their position in the list)
+    through timesteps, only processing bees with an action due.
+    """
+    def __init__(self, bees, sites):
+        self.bees = bees
+        self.sites = sites
+        self.site_indexes = {direction: i for i, direction in enumerate(sites)} # columns of private_counts
+        self.timestep = 0 # the next timestep to process
+        self.idle_bees = hiveSim.IdleIndex(bees)
+        # every action is at most MAX_DELAY timesteps ahead, so the queue is a ring of
+        # buckets: bucket t % (MAX_DELAY+1) holds the bee_id of each waggling or foraging
+        # bee whose next action is at timestep t (sorted into list order when its turn comes)
+        self.events = [[] for _ in range(MAX_DELAY+1)]
+        for bee in bees:
+            if bee.state == 1:
+                self.schedule(0, bee)
+            elif bee.state == 2:
+                # the forager counts down foragingTurns to -1, then arrives the timestep after
+                self.schedule(max(bee.foragingTurns+1, 0), bee)
+
+    def schedule(self, t, bee):
+        """Queues the bee's next action for timestep t
+        """
+        if not self.timestep <= t <= self.timestep + MAX_DELAY:
+            raise ValueError("actions can only be scheduled up to MAX_DELAY timesteps ahead")
+        self.events[t % len(self.events)].append(bee.bee_id)
+
+    def step(self, instrumentation=None, stats=None):
+        """
+        Processes one timestep, as hiveSim.timestep does (with the same optional
+        instrumentation and stats). Returns a dictionary of sites:#bees that found
+        that site this timestep.
+        """
+        if instrumentation is not None:
+            instrumentation.start_timestep()
+        t = self.timestep
+        bees = self.bees
+        sites = self.sites
+        idle_bees = self.idle_bees
+        recruited_total = 0
+        stopped_dancing = 0
+        found_nothing = 0
+        site_numbers = dict.fromkeys(sites, 0)
+        events = self.events
+        slots = len(events)
+        due = events[t % slots]
+        events[t % slots] = []
+        due.sort() # bees act in list order, as in hiveSim.timestep
+        # the buckets actions are scheduled into (bee_id lists, appended to directly)
+        next_timestep = events[(t+1) % slots]
+        in_three = events[(t+3) % slots]
+        in_four = events[(t+4) % slots]
+        for bee_id in due:
+            bee = bees[bee_id]
+
+            # waggle dancing bee: recruit idle bees, dance again next timestep unless finished
+            if bee.state == 1:
+                recruited = hiveSim.recruit(idle_bees, bee.waggle_direction)
+                recruited_total += len(recruited)
+                for recruit in recruited:
+                    # a recruit after the dancer in the list counts down once this timestep
+                    # too, as hiveSim.timestep reaches it later in the same sweep
+                    if recruit.bee_id > bee_id:
+                        in_three.append(recruit.bee_id)
+                    else:
+                        in_four.append(recruit.bee_id)
+                bee.waggle_turns -= 1
+                if bee.waggle_turns <= 0:
+                    bee.state = 0
+                    idle_bees.add(bee)
+                    stopped_dancing += 1
+                else:
+                    next_timestep.append(bee_id)
+
+            # foraging bee arriving: waggle dance next timestep if it found a site
+            else:
+                bee.foragingTurns = -1
+                use_public = hiveSim.use_public_location()
+                direction = hiveSim.work_out_direction(bee, use_public, sites)
+                if direction in sites:
+                    site_numbers[direction] += 1
+                    bee.state = 1
+                    bee.waggle_turns = sites.get(direction)/10
+                    bee.waggle_direction = direction
+                    bee.private_counts[self.site_indexes[direction]] += 1
+                    next_timestep.append(bee_id)
+                else:
+                    bee.state = 0
+                    idle_bees.add(bee)
+                    found_nothing += 1
+
+        self.timestep += 1
+        found_site = sum(site_numbers.values())
+        if instrumentation is not None:
+            instrumentation.record_transition("recruited", recruited_total)
+            instrumentation.record_transition("stopped_dancing", stopped_dancing)
+            instrumentation.record_transition("found_site", found_site)
+            instrumentation.record_transition("found_nothing", found_nothing)
+            instrumentation.end_timestep(self.bees)
+        if stats is not None:
+            stats.add_transitions(recruited_total, stopped_dancing, found_site, found_nothing)
+            stats.add_to_site_stats(site_numbers)
+        return site_numbers
@@ -0,0 +1,67 @@
+"""
+Opt-in instrumentation for the hive timestep loop: per-timestep counts of each
+kind of state transition, per-phase timers and hooks.
+The timestep loops count transitions in local variables either way, and pass them on
+once at the end of the timestep, so when no instrumentation is passed it costs two
+'is None' checks per timestep.
+
+@author: tp275
+"""
+import time
+from collections import Counter, defaultdict
+
+# the state transitions that are counted
+TRANSITIONS = ("recruited", # idle -> foraging, through a waggle dance
+               "stopped_dancing", # waggling -> idle
+               "found_site", # foraging -> waggling
+               "found_nothing") # foraging -> idle
+
+class HiveInstrumentation:
+    """
+    Counters, timers and hooks for hiveSim.timestep.
+    Hooks are callbacks for these events, called with the given arguments:
+        "timestep_end" (timestep, bees, transition counts of the timestep)
+    """
+    def __init__(self):
+        self.transition_counts = [] # per timestep, a dict of transition: count
+        self.current = Counter()
+        self.timers = Counter() # total seconds spent in each phase
+        self.hooks = defaultdict(list)
+        self.timestep_start = 0.0
+
+    def add_hook(self, event, callback):
+        """Registers a callback to be called at every occurrence of the given event
+        """
+        self.hooks[event].append(callback)
+
+    def call_hooks(self, event, *args):
+        for callback in self.hooks[event]:
+            callback(*args)
+
+    def add_time(self, phase, seconds):
+        self.timers[phase] += seconds
+
+    def record_transition(self, transition, count=1):
+        self.current[transition] += count
+
+    def start_timestep(self):
+        self.current = Counter()
+        self.timestep_start = time.perf_counter()
+
+    def end_timestep(self, bees):
+        """Stores this timestep's transition counts and passes them to any hooks
+        """
+        self.add_time("timestep", time.perf_counter()-self.timestep_start)
+        counts = {transition: self.current[transition] for transition in TRANSITIONS}
+        self.transition_counts.append(counts)
+        self.call_hooks("timestep_end", len(self.transition_counts)-1, bees, counts)
+
+    def summary(self):
+        """Returns a dictionary of total transition counts and timers
+        """
+        totals = Counter()
+        for counts in self.transition_counts:
+            totals.update(counts)
+        return {"timesteps": len(self.transition_counts),
+                "transitions": {transition: totals[transition] for transition in TRANSITIONS},
+                "timers": dict(self.timers)}
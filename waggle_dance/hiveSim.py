@@ -6,116 +6,242 @@ Inspired by 'The honeybee waggle dance[...]' (Grüter & Farina, 2009)
 @author: tp275
 """
 import numpy as np
+import math
 import random
-import matplotlib.pyplot as plt
+import itertools
+from collections import namedtuple
+import hiveInstrumentation
+import colonyEngine
+import siteIndex
+import hiveEvents
+
+sites = {0:100, 45:10, 90:50, 135:10, 180:100, 225:10, 270:50, 315:10} # location :quality
 
 class Bee:
-    def __init__(self, bee_id, ):
+    def __init__(self, bee_id, private_counts=None):
         self.bee_id = bee_id
         self.state = 0 # 0=idle in nest, 1=performing waggle dance, 2=foraging
         self.foragingTurns = 0
         self.waggle_turns = 0 # how many turns left in waggle dance state
         self.waggle_direction = 0
         self.public_direction = 0
-        self.private_direction = [] # list of the bee's own stored directions
+        # how many times the bee has found each site (in the order of sites), as its own
+        # stored directions: usually a row of the colony's matrix (see create_bees)
+        self.private_counts = np.zeros(len(sites), dtype=np.int32) if private_counts is None else private_counts
 
     def speak(self):
         print(str(self.bee_id) + " says: BUZZ!")
 
 
 class BeeStats:
-    def __init__(self, timesteps):
+    """
+    Per-timestep numbers of bees in each state and at each site, kept in numpy arrays
+    allocated up front. After the first count, state numbers are worked out from the
+    timestep's state transitions rather than by going through every bee again.
+    """
+    def __init__(self, timesteps, sites=sites, state_counts=None, site_matrix=None):
+        """
+        sites is a dictionary of site direction: quality, or a siteIndex.SiteIndex.
+        The numbers can be written into existing (timesteps+1, 3) and (timesteps, sites)
+        arrays, such as views of shared memory, given as state_counts and site_matrix.
+        """
         self.timesteps = timesteps
-        self.num_idle = []
-        self.num_waggle = []
-        self.num_forage = []
-        self.site_numbers = []
-        self.site_matrix = np.zeros((timesteps, 8))
-        
+        self.site_qualities = get_site_qualities(sites)
+        if state_counts is None:
+            state_counts = np.zeros((timesteps+1, 3), dtype=np.int64) # idle, waggle, forage
+        if site_matrix is None:
+            site_matrix = np.zeros((timesteps, len(sites)))
+        self.state_counts = state_counts
+        self.num_states = 0 # rows of state_counts filled so far
+        self.site_matrix = site_matrix
+        self.num_site_rows = 0 # rows of site_matrix filled so far
+
+    # the state numbers recorded so far
+    @property
+    def num_idle(self):
+        return self.state_counts[:self.num_states, 0]
+
+    @property
+    def num_waggle(self):
+        return self.state_counts[:self.num_states, 1]
+
+    @property
+    def num_forage(self):
+        return self.state_counts[:self.num_states, 2]
+
+    def add_state_counts(self, idle, waggle, forage):
+        if self.num_states == len(self.state_counts): # more timesteps than expected
+            self.state_counts = np.vstack((self.state_counts, np.zeros_like(self.state_counts)))
+        self.state_counts[self.num_states] = idle, waggle, forage
+        self.num_states += 1
+
     def add_to_state_stats(self, bees):
         """
-        Given list of bees, totals up how many are in each state and appends
-        that total to lists of state totals. To be called per timestep.
-        """
-        idle = 0
-        waggle = 0
-        forage = 0
-        for b in bees:
-            if b.state == 0:
-                idle += 1
-            elif b.state == 1:
-                waggle += 1
-            elif b.state == 2:
-                forage += 1
-        self.num_idle.append(idle)
-        self.num_waggle.append(waggle)
-        self.num_forage.append(forage)
+        Given list of bees (or a colonyEngine.Colony), totals up how many are in each state
+        and appends that total to the state totals. Needed for the first timestep only,
+        after which add_transitions keeps the totals up to date.
+        """
+        self.add_state_counts(*count_states(bees))
+
+    def add_transitions(self, recruited, stopped_dancing, found_site, found_nothing):
+        """
+        Appends the state totals after a timestep with the given numbers of each state
+        transition (see hiveInstrumentation.TRANSITIONS) to the state totals before it
+        """
+        self.add_state_counts(*apply_transitions(self.state_counts[self.num_states-1].tolist(),
+                                                 recruited, stopped_dancing, found_site, found_nothing))
                 
+    # matplotlib is only imported when plotting, so processes that only simulate
+    # (such as hiveEnsemble's workers) start quickly
     def show_state_stats(self):
-        plt.plot(range(timesteps+1), self.num_idle, label="Bees idle in nest")
-        plt.plot(range(timesteps+1), self.num_waggle, label="Bees performing waggle dance")
-        plt.plot(range(timesteps+1), self.num_forage, label="Bees foraging")
+        import matplotlib.pyplot as plt
+        plt.plot(range(self.num_states), self.num_idle, label="Bees idle in nest")
+        plt.plot(range(self.num_states), self.num_waggle, label="Bees performing waggle dance")
+        plt.plot(range(self.num_states), self.num_forage, label="Bees foraging")
         plt.legend()
         
     def add_to_site_stats(self, site_numbers):
-        """Appends, per timestep, a dictionary containing sites:#bees in that site
         """
-        self.site_numbers.append(site_numbers)
+        Adds, per timestep, a row of the number of bees that found each site: a dictionary
+        of sites:#bees in that site, or the numbers in the order of sites
+        """
+        if isinstance(site_numbers, dict):
+            site_numbers = list(site_numbers.values())
+        if self.num_site_rows == len(self.site_matrix): # more timesteps than expected
+            self.site_matrix = np.vstack((self.site_matrix, np.zeros_like(self.site_matrix)))
+        self.site_matrix[self.num_site_rows] = site_numbers
+        self.num_site_rows += 1
         
     def show_site_stats(self):
         """
-        Creates a matrix containing numbers of bees in the different sites at each timestep:
-        8 columns represent sites, rows are per timestep, values are the number of bees in the site
-        This is then used to plot the number of bees at all sites per timestep,
-        as well as other purposes in other methods
+        Plots the number of bees at all sites per timestep, from the site_matrix:
+        columns represent sites, rows are per timestep, values are the number of bees in the site
         """
-        for i in range(self.timesteps):
-            self.site_matrix[i] = list(self.site_numbers[i].values())
-        
-        plt.plot(range(self.timesteps), [np.sum(self.site_matrix[i]) for i in range(self.timesteps)], label="Bees at sites")
+        import matplotlib.pyplot as plt
+        plt.plot(range(self.num_site_rows), self.site_matrix[:self.num_site_rows].sum(axis=1),
+                 label="Bees at sites")
         plt.legend()
         plt.show()
+
+    def get_total_qualities(self):
+        """
+        Returns, per timestep, the total site quality experienced by all currently foraging
+        bees (total = sum(each foraging bee * its site quality))
+        """
+        return self.site_matrix[:self.num_site_rows] @ self.site_qualities
         
     def show_total_quality(self):
         """
-        Plots, using the site_matrix and a dictionary of sites and their qualities,
-        the total site quality experienced by all currently foraging bees
-        (total = sum(each foraging bee * its site quality))
-        Also plotted is the mean calculated using 'bin' sizes set by numForMean
-        """
-        sites = {0:100, 1:10, 2:50, 3:10, 4:100, 5:10, 6:50, 7:10}
-        timesteps = len(self.site_numbers)
-        qualities = []
-        for i in range(timesteps):
-            total = 0
-            row = self.site_matrix[i]
-            for j in range(8):
-                total += (row[j] * sites.get(j))
-            qualities.append(total)
+        Plots the total site quality experienced by all currently foraging bees (see
+        get_total_qualities). Also plotted is the mean calculated using 'bin' sizes set by numForMean
+        """
+        import matplotlib.pyplot as plt
+        qualities = self.get_total_qualities()
+        timesteps = len(qualities)
         plt.plot(range(timesteps), qualities, label="Total quality")
         
         numForMean = 50
-        avQualities = []
-        for i in range(int(timesteps/numForMean)):
-            avQualities.append(np.mean(qualities[i*numForMean:(i+1)*numForMean]))
-        plt.plot(range(0, timesteps, numForMean), avQualities, 'r', linewidth=3, label="Average quality")
+        bins = int(timesteps/numForMean)
+        avQualities = qualities[:bins*numForMean].reshape(bins, numForMean).mean(axis=1)
+        plt.plot(range(0, timesteps, numForMean)[:bins], avQualities, 'r', linewidth=3, label="Average quality")
 
         plt.legend()
         
 
-def recruit(bees, waggle_direction):
+def get_site_qualities(sites):
+    """Returns an array of the site qualities, from a dictionary of site direction: quality or a siteIndex.SiteIndex
     """
-    Goes through idle bees, turns them into foraging bees with certain probability
-    Foraging bees have a 'public' direction assigned from the waggle dancing bee, +- some error
+    if isinstance(sites, siteIndex.SiteIndex):
+        return sites.qualities
+    return np.array(list(sites.values()))
+
+def count_states(bees):
+    """Returns how many of a list of bees (or a colonyEngine.Colony) are idle, waggle dancing and foraging
     """
+    if isinstance(bees, colonyEngine.Colony):
+        return bees.count_states()
+    idle = 0
+    waggle = 0
+    forage = 0
     for b in bees:
         if b.state == 0:
-            if random.random() < 0.1:
-                b.state = 2 # recruit bee to foraging
-                b.foragingTurns = 2
-                b.public_direction = waggle_direction + random.randrange(-90,90)
+            idle += 1
+        elif b.state == 1:
+            waggle += 1
+        elif b.state == 2:
+            forage += 1
+    return idle, waggle, forage
+
+def apply_transitions(state_counts, recruited, stopped_dancing, found_site, found_nothing):
+    """
+    Returns the numbers of bees idle, waggle dancing and foraging after a timestep with
+    the given numbers of each state transition, from the numbers before it
+    """
+    idle, waggle, forage = state_counts
+    return (idle + stopped_dancing + found_nothing - recruited,
+            waggle + found_site - stopped_dancing,
+            forage + recruited - found_site - found_nothing)
+
+
+class IdleIndex:
+    """
+    The bees idle in the nest, kept up to date as bees change state, so recruitment
+    can pick from them without going through the whole colony.
+    Bees are added and removed in constant time (removal swaps in the last bee).
+    """
+    def __init__(self, bees):
+        self.bees = [b for b in bees if b.state == 0]
+        self.positions = {b.bee_id: i for i, b in enumerate(self.bees)}
+
+    def __len__(self):
+        return len(self.bees)
+
+    def add(self, bee):
+        self.positions[bee.bee_id] = len(self.bees)
+        self.bees.append(bee)
+
+    def remove(self, bee):
+        position = self.positions.pop(bee.bee_id)
+        last = self.bees.pop()
+        if last is not bee:
+            self.bees[position] = last
+            self.positions[last.bee_id] = position
+
+
+def binomial(n, p):
+    """
+    Returns a number drawn from the binomial distribution of n trials with success
+    probability p, by counting the geometrically distributed gaps between successes
+    that fit in n trials, which takes time proportional to the number returned
+    """
+    if p >= 1:
+        return n
+    log_q = math.log(1-p)
+    successes = 0
+    trials = 0
+    while True:
+        trials += int(math.log(1-random.random()) / log_q) + 1 # trials up to the next success
+        if trials > n:
+            return successes
+        successes += 1
+
+def recruit(idle_bees, waggle_direction):
+    """
+    Turns each idle bee (in the IdleIndex idle_bees) into a foraging bee with probability 0.1,
+    by drawing how many are recruited from the binomial distribution, then sampling that
+    many idle bees without replacement, so it takes time proportional to the recruits.
+    Foraging bees have a 'public' direction assigned from the waggle dancing bee, +- some error
+    Returns the list of bees recruited
+    """
+    recruited = random.sample(idle_bees.bees, binomial(len(idle_bees), 0.1))
+    for b in recruited:
+        idle_bees.remove(b)
+        b.state = 2 # recruit bee to foraging
+        b.foragingTurns = 2
+        b.public_direction = waggle_direction + random.randrange(-90,90)
+    return recruited
                 
-def work_out_direction(bee, use_public): # TODO:
+def work_out_direction(bee, use_public, sites=sites): # TODO:
     """
     Determines and returns a location for a foraging bee to go to
     """
@@ -124,9 +250,16 @@ def work_out_direction(bee, use_public): # TODO:
         # TODO: some mix of private and public info. Perhaps use public to set a good private location
     else:
         # TODO: return one of the bee's private directions if it has any.
-        if not bee.private_direction:
+        counts = bee.private_counts.tolist()
+        total = sum(counts)
+        if not total:
             return random.randrange(0,360)
-        return random.choice(bee.private_direction)
+        # pick a found site with probability proportional to how often it was found
+        r = random.randrange(total)
+        for direction, count in zip(sites, counts):
+            r -= count
+            if r < 0:
+                return direction
     
 def use_public_location():
     """
@@ -139,9 +272,14 @@ def use_public_location():
     return True
 
 
-if __name__ == "__main__":
-    
-    bees = [Bee(i) for i in range(500)] # create list of bees
+def create_bees(num_bees, sites=sites):
+    """
+    Returns a list of the given number of bees, with a few of them initially waggling.
+    The bees' private counts are the rows of one (bees, sites) matrix, so memory
+    stays the same however many times they find sites.
+    """
+    private_counts = np.zeros((num_bees, len(sites)), dtype=np.int32)
+    bees = [Bee(i, private_counts[i]) for i in range(num_bees)] # create list of bees
     
     # Set up some bees to be initially waggling:
     bees[0].state = 1
@@ -159,55 +297,217 @@ if __name__ == "__main__":
     bees[3].state = 1
     bees[3].waggle_turns = 1
     bees[3].waggle_direction = 225
+    return bees
+
+def timestep(bees, sites, instrumentation=None, stats=None, idle_bees=None):
+    """
+    Goes through every bee once, performing the action for its state.
+    Returns a dictionary of sites:#bees that found that site this timestep
+    If given, a HiveInstrumentation counts each state transition and times the timestep,
+    and the state transitions and site numbers are added to a BeeStats.
+    An IdleIndex of the bees can be given as idle_bees, to be kept up to date from one
+    timestep to the next, instead of being rebuilt from bees every timestep.
+    """
+    if instrumentation is not None:
+        instrumentation.start_timestep()
+    # numbers of each state transition this timestep
+    recruited_total = 0
+    stopped_dancing = 0
+    found_nothing = 0
+    site_numbers = dict.fromkeys(sites, 0)
+    site_indexes = {direction: i for i, direction in enumerate(sites)} # columns of private_counts
+    if idle_bees is None:
+        idle_bees = IdleIndex(bees) # updated whenever a bee becomes, or stops being, idle
+    for bee in bees:
+        #print(bee.state)
+        
+        # if bee is idle in nest, do nothing # TODO: With some small chance, leave without seeing waggle dance
+        if bee.state == 0:
+            continue
+        
+        # if bee is waggle dancing
+        elif bee.state == 1:
+            recruited = recruit(idle_bees, bee.waggle_direction) # recruit idle bees
+            recruited_total += len(recruited)
+            bee.waggle_turns -= 1
+            if bee.waggle_turns <= 0:
+                bee.state = 0
+                idle_bees.add(bee)
+                stopped_dancing += 1
+                
+        # if bee is foraging
+        elif bee.state == 2:
+            if bee.foragingTurns < 0:
+                use_public = use_public_location()
+                direction = work_out_direction(bee, use_public, sites)
+                if direction in sites:
+                    # TODO: DO STATS
+                    site_numbers[direction] += 1
+                    bee.state = 1
+                    bee.waggle_turns = sites.get(direction)/10
+                    bee.waggle_direction = direction
+                    bee.private_counts[site_indexes[direction]] += 1
+                else:
+                    # TODO: stats
+                    bee.state = 0
+                    idle_bees.add(bee)
+                    found_nothing += 1
+            else:
+                bee.foragingTurns -= 1
+    found_site = sum(site_numbers.values())
+    if instrumentation is not None:
+        instrumentation.record_transition("recruited", recruited_total)
+        instrumentation.record_transition("stopped_dancing", stopped_dancing)
+        instrumentation.record_transition("found_site", found_site)
+        instrumentation.record_transition("found_nothing", found_nothing)
+        instrumentation.end_timestep(bees)
+    if stats is not None:
+        stats.add_transitions(recruited_total, stopped_dancing, found_site, found_nothing)
+        stats.add_to_site_stats(site_numbers)
+    return site_numbers
+
+
+# the numbers of one timestep, as yielded by HiveSimulation.run: the timestep's number
+# (from 1), the bees in each state after it, a dictionary of sites:#bees that found
+# that site, and the total quality of the sites found (see BeeStats.get_total_qualities)
+HiveSnapshot = namedtuple("HiveSnapshot", ("timestep", "idle", "waggle", "forage",
+                                           "site_numbers", "total_quality"))
+
+class HiveSimulation:
+    """
+    A hive simulation that can be run one timestep at a time, giving a HiveSnapshot of
+    each timestep as it happens, so results can be written out, downsampled or checked
+    for convergence as the simulation goes, and it can be stopped at any point.
+    The bees are stepped by timestep, a colonyEngine.Colony or a hiveEvents.EventScheduler,
+    as chosen. Only the latest timestep's numbers are kept, unless a BeeStats is
+    given as stats, which is then kept up to date with every timestep.
+    """
+    def __init__(self, num_bees, sites=sites, use_colony_engine=False, use_event_scheduler=False,
+                 instrumentation=None, stats=None):
+        """
+        sites is a dictionary of site direction: quality, or (with use_colony_engine only)
+        a siteIndex.SiteIndex of patches at continuous angles and distances
+        """
+        if use_colony_engine:
+            self.bees = colonyEngine.Colony(num_bees, sites)
+        elif isinstance(sites, siteIndex.SiteIndex):
+            raise ValueError("a siteIndex.SiteIndex of sites needs use_colony_engine")
+        else:
+            self.bees = create_bees(num_bees, sites)
+        self.sites = sites
+        self.site_qualities = get_site_qualities(sites)
+        self.scheduler = None
+        if use_event_scheduler and not use_colony_engine:
+            self.scheduler = hiveEvents.EventScheduler(self.bees, sites)
+        # the idle bees, kept up to date across timesteps rather than rebuilt every timestep
+        # (the scheduler keeps its own)
+        self.idle_bees = None if use_colony_engine or self.scheduler is not None else IdleIndex(self.bees)
+        self.instrumentation = instrumentation
+        self.stats = stats
+        self.timestep = 0 # timesteps done so far
+        self.state_counts = count_states(self.bees) # idle, waggle, forage
+        if stats is not None:
+            stats.add_state_counts(*self.state_counts)
+
+    # each timestep's numbers are passed to these, as they would be to a BeeStats
+    def add_transitions(self, recruited, stopped_dancing, found_site, found_nothing):
+        self.state_counts = apply_transitions(self.state_counts, recruited, stopped_dancing,
+                                              found_site, found_nothing)
+        if self.stats is not None:
+            self.stats.add_transitions(recruited, stopped_dancing, found_site, found_nothing)
+
+    def add_to_site_stats(self, site_numbers):
+        if self.stats is not None:
+            self.stats.add_to_site_stats(site_numbers)
+
+    def step(self):
+        """Performs one timestep, and returns its HiveSnapshot
+        """
+        if self.scheduler is not None:
+            site_numbers = self.scheduler.step(self.instrumentation, self)
+        elif isinstance(self.bees, colonyEngine.Colony):
+            site_numbers = self.bees.timestep(self.instrumentation, self)
+        else:
+            site_numbers = timestep(self.bees, self.sites, self.instrumentation, self, self.idle_bees)
+        self.timestep += 1
+        total_quality = float(np.dot(list(site_numbers.values()), self.site_qualities))
+        return HiveSnapshot(self.timestep, *self.state_counts, site_numbers, total_quality)
+
+    def run(self, timesteps=None):
+        """
+        Generator of the HiveSnapshot of each timestep, for the given number of timesteps,
+        or for as long as it is iterated over if None. For example, every 10th timestep
+        until the number of bees foraging settles down:
+            for snapshot in itertools.islice(simulation.run(), 0, None, 10):
+                ...
+                if converged:
+                    break
+        """
+        for _ in range(timesteps) if timesteps is not None else itertools.count():
+            yield self.step()
+
+    def __iter__(self):
+        return self.run()
+
+
+if __name__ == "__main__":
     
     #####
+    num_bees = 500
     timesteps = 1000 # how many turns to go through every bee and perform action    
+    use_colony_engine = False # toggles storing the colony as arrays, for large colonies (see colonyEngine.py)
+    # the event scheduler gives the same results as the sweep, but is no faster in this model: about a third
+    # of the bees dance, are recruited or arrive every timestep, and the sweep only checks the rest.
+    # It would pay off in models with long quiescent spells, such as longer foraging trips
+    use_event_scheduler = False # toggles only processing bees with an action due each timestep (see hiveEvents.py)
+    landscape_patches = 0 # if non-zero, the colony engine forages over this many patches at random angles and distances (see siteIndex.py)
+    instrument = False # toggles per-timestep transition counts and timers (see hiveInstrumentation.py)
+    checkpoint_path = None # if set, a file the hive is saved to periodically, and resumed from (see ../trapline_formation/checkpoint.py)
+    checkpoint_every = 100 # timesteps between snapshots
     #####
-    
-    sites = {0:100, 45:10, 90:50, 135:10, 180:100, 225:10, 270:50, 315:10} # location :quality
-    stats = BeeStats(timesteps)
-    stats.add_to_state_stats(bees)
+    if landscape_patches:
+        if not use_colony_engine:
+            raise ValueError("landscape_patches needs use_colony_engine")
+        # patches anywhere from 50 to 1000 distance units away, with the same qualities as sites
+        landscape_rng = np.random.default_rng()
+        sites = siteIndex.SiteIndex(landscape_rng.uniform(0, 360, landscape_patches),
+                                    landscape_rng.choice([10, 50, 100], landscape_patches),
+                                    landscape_rng.uniform(50, 1000, landscape_patches),
+                                    angle_tolerance=0.5, distance_tolerance=25)
+    instrumentation = hiveInstrumentation.HiveInstrumentation() if instrument else None
+    # each timestep's state and site numbers are added to stats
+    simulation = HiveSimulation(num_bees, sites, use_colony_engine, use_event_scheduler,
+                                instrumentation, BeeStats(timesteps, sites))
+
+    checkpointer = None
+    if checkpoint_path:
+        # checkpoints are saved by the same Checkpointer as the trapline simulation's
+        import os
+        import sys
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "trapline_formation"))
+        import checkpoint
+        checkpointer = checkpoint.Checkpointer(checkpoint_path, checkpoint_every)
+        parameters = [num_bees, timesteps, use_colony_engine, use_event_scheduler, landscape_patches]
+        resumed = checkpointer.load()
+        if resumed is not None:
+            if resumed["parameters"] != parameters:
+                raise ValueError("checkpoint " + checkpoint_path
+                                 + " is of a simulation with different parameters")
+            simulation = resumed["simulation"]
+            random.setstate(resumed["random_state"])
         
-    for i in range(timesteps):
+    for snapshot in simulation.run(timesteps - simulation.timestep):
         
-        if i % 20 == 0:
-            print("\nTimestep: " + str(i))
+        if (snapshot.timestep-1) % 20 == 0:
+            print("\nTimestep: " + str(snapshot.timestep-1))
             
-        site_numbers = {0:0, 45:0, 90:0, 135:0, 180:0, 225:0, 270:0, 315:0}
-        for bee in bees:
-            #print(bee.state)
-            
-            # if bee is idle in nest, do nothing # TODO: With some small chance, leave without seeing waggle dance
-            if bee.state == 0:
-                continue
-            
-            # if bee is waggle dancing
-            elif bee.state == 1:
-                recruit(bees, bee.waggle_direction) # recruit idle bees
-                bee.waggle_turns -= 1
-                if bee.waggle_turns <= 0:
-                    bee.state = 0
-                    
-            # if bee is foraging
-            elif bee.state == 2:
-                if bee.foragingTurns < 0:
-                    use_public = use_public_location()
-                    direction = work_out_direction(bee, use_public)
-                    if direction in sites:
-                        # TODO: DO STATS
-                        site_numbers[direction] += 1
-                        bee.state = 1
-                        bee.waggle_turns = sites.get(direction)/10
-                        bee.waggle_direction = direction
-                        bee.private_direction.append(direction)
-                    else:
-                        # TODO: stats
-                        bee.state = 0
-                else:
-                    bee.foragingTurns -= 1
-                    
-        stats.add_to_state_stats(bees)
-        stats.add_to_site_stats(site_numbers)
-    stats.show_state_stats()
-    stats.show_site_stats()
-    stats.show_total_quality()
\ No newline at end of file
+        if checkpointer is not None and checkpointer.is_due(snapshot.timestep):
+            checkpointer.save({"parameters": parameters, "simulation": simulation,
+                               "random_state": random.getstate()})
+    if checkpointer is not None:
+        checkpointer.remove() # finished, so the next simulation starts afresh
+    if instrument:
+        print(simulation.instrumentation.summary())
+    simulation.stats.show_state_stats()
+    simulation.stats.show_site_stats()
+    simulation.stats.show_total_quality()
@@ -0,0 +1,95 @@
+"""
+An index of foraging sites (flower patches) at continuous angles and distances from
+the hive, for landscapes with many more patches than hiveSim's eight sites.
+It answers "which patch, if any, lies within tolerance of this heading and range"
+for a whole array of headings at once: the patches are kept sorted by angle, so each
+heading's candidate patches are found with a binary search, and only those are checked.
+
+@author: tp275
+"""
+import numpy as np
+
+class SiteIndex:
+    """
+    Patches given as arrays of angle (degrees), distance and quality. A heading finds
+    the patch within angle_tolerance of it (and, if a range is given, within
+    distance_tolerance of that), choosing the closest if there are several.
+    With periodic set, angles wrap around, so a heading of 359 finds a patch at 1.
+    """
+    def __init__(self, angles, qualities, distances=None, angle_tolerance=0.0,
+                 distance_tolerance=np.inf, periodic=True):
+        self.angles = np.asarray(angles, dtype=float)
+        self.qualities = np.asarray(qualities, dtype=float)
+        self.distances = np.zeros(len(self.angles)) if distances is None else np.asarray(distances, dtype=float)
+        if not 0 <= angle_tolerance < 180:
+            raise ValueError("angle_tolerance must be between 0 and 180 degrees")
+        self.angle_tolerance = angle_tolerance
+        self.distance_tolerance = distance_tolerance
+        self.periodic = periodic
+
+        sites = np.arange(len(self.angles))
+        angles = self.angles
+        if periodic:
+            # a copy of the patches either side of 0-360, so headings near 0 or 360
+            # find the patches on the other side without any special cases
+            angles = np.mod(angles, 360)
+            angles = np.concatenate((angles-360, angles, angles+360))
+            sites = np.tile(sites, 3)
+        order = np.argsort(angles, kind="stable")
+        self.sorted_angles = angles[order]
+        self.sorted_sites = sites[order]
+
+    @classmethod
+    def from_sites(cls, sites):
+        """
+        Creates an index of a dictionary of site direction: quality, as in hiveSim.
+        Only exact directions find a site, and directions don't wrap around,
+        exactly as hiveSim's 'direction in sites'.
+        """
+        return cls(list(sites), list(sites.values()), periodic=False)
+
+    def __len__(self):
+        return len(self.angles)
+
+    def query(self, headings, ranges=None):
+        """
+        Returns, for each heading (and range, if given), the index of the patch found,
+        or -1 where no patch is within tolerance
+        """
+        headings = np.asarray(headings, dtype=float)
+        if self.periodic:
+            headings = np.mod(headings, 360)
+        check_ranges = ranges is not None and np.isfinite(self.distance_tolerance)
+        if check_ranges:
+            ranges = np.broadcast_to(np.asarray(ranges, dtype=float), headings.shape)
+        first = np.searchsorted(self.sorted_angles, headings - self.angle_tolerance, side="left")
+        if self.angle_tolerance == 0 and not check_ranges:
+            # only a patch at exactly the heading will do, and the search lands on it
+            first = np.minimum(first, len(self.sorted_angles)-1)
+            return np.where(self.sorted_angles[first] == headings, self.sorted_sites[first], -1)
+        last = np.searchsorted(self.sorted_angles, headings + self.angle_tolerance, side="right")
+        candidates = last - first # number of patches within angle tolerance of each heading
+
+        found = np.full(headings.shape, -1, dtype=np.int64)
+        best_error = np.full(headings.shape, np.inf)
+        angle_scale = self.angle_tolerance if self.angle_tolerance > 0 else 1.0
+        distance_scale = self.distance_tolerance if self.distance_tolerance > 0 else 1.0
+        # check the k'th candidate of every heading with at least k candidates at once
+        for k in range(candidates.max() if candidates.size else 0):
+            querying = np.flatnonzero(candidates > k)
+            position = first[querying] + k
+            sites = self.sorted_sites[position]
+            error = ((self.sorted_angles[position] - headings[querying]) / angle_scale)**2
+            if check_ranges:
+                distance_error = np.abs(self.distances[sites] - ranges[querying])
+                within = distance_error <= self.distance_tolerance
+                error = np.where(within, error + (distance_error/distance_scale)**2, np.inf)
+            better = error < best_error[querying]
+            found[querying[better]] = sites[better]
+            best_error[querying[better]] = error[better]
+        return found
+
+    def find(self, heading, range=None):
+        """Returns the index of the patch found at a single heading (and range), or -1
+        """
+        return int(self.query(np.array([heading]), None if range is None else np.array([range]))[0])